@@ -0,0 +1,70 @@
+import re
+import html
+import logging
+
+logger = logging.getLogger(__file__)
+
+from .transpile import cythonize, getDirectives
+
+linePattern = re.compile(r'<pre class="cython line score-(\d+)"[^>]*>.?<span class="">(\d+)</span>: (.*?)</pre>')
+
+
+def parseAnnotation(htmlPath):
+    lines = []
+    for match in linePattern.finditer(htmlPath.read_text(encoding="utf-8")):
+        score, lineNumber, source = match.groups()
+        lines.append((int(score), int(lineNumber), html.unescape(source)))
+    return lines
+
+
+def annotate(sourcePath, exeName, sources, directives={}, jobs=None, top=50):
+    """
+    Cythonizes all modules with annotation into build/annotate/<exeName> and writes report.txt, a ranked
+    list of the source lines with the most Python C-API interaction (the Cython annotation score).
+    """
+    annotatePath = sourcePath / "build" / "annotate" / exeName
+    annotatePath.mkdir(parents=True, exist_ok=True)
+
+    sourceSet = set()
+    for source in sources:
+        sourceSet.update(sourcePath.glob(source))
+
+    modules = []
+    for filePath in sorted(sourceSet):
+        if filePath.stem == "__init__":
+            continue
+        outputPath = (annotatePath / filePath.stem).with_suffix(".c")
+        modules.append((filePath, outputPath, False, getDirectives(filePath, sourcePath, directives), True))
+
+    cythonize(modules, jobs=jobs)
+
+    hotspots = []
+    moduleScores = []
+    for (filePath, outputPath, *rest) in modules:
+        lines = parseAnnotation(outputPath.with_suffix(".html"))
+        moduleScores.append((sum(score for (score, lineNumber, source) in lines), filePath))
+        for (score, lineNumber, source) in lines:
+            if score:
+                hotspots.append((score, filePath, lineNumber, source))
+
+    hotspots.sort(key=lambda x: x[0], reverse=True)
+    moduleScores.sort(key=lambda x: x[0], reverse=True)
+
+    report = [f"Annotation report for {exeName}", "", "Modules by total score:"]
+    for (score, filePath) in moduleScores:
+        report.append(f"{score:8d}  {filePath.as_posix()}")
+
+    hotspotLines = []
+    for (score, filePath, lineNumber, source) in hotspots[:top]:
+        hotspotLines.append(f"{score:8d}  {filePath.as_posix()}:{lineNumber}  {source.strip()}")
+
+    report += ["", f"Top {top} lines by score:"] + hotspotLines
+
+    reportPath = annotatePath / "report.txt"
+    reportPath.write_text("\n".join(report) + "\n")
+
+    print(f"Top hotspots of {exeName}:")
+    print("\n".join(hotspotLines[:10]))
+    print(f"Annotation report written to {str(reportPath)}")
+
+    return reportPath
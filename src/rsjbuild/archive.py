@@ -0,0 +1,703 @@
+import os
+import time
+import json
+import stat
+import lzma
+import zlib
+import hashlib
+import shutil
+import struct
+import pathlib
+import tarfile
+import zipfile
+import contextlib
+import collections
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__file__)
+
+from .transpile import getJobs, workerSlot
+from .getversion import getSourceDateEpoch
+from .manifest import hashFile
+
+# Local file header: signature, versions, flags, method, time, date, crc, sizes, name length, extra length
+localHeader = struct.Struct("<4s2B4HL2L2H")
+
+# Extended timestamp extra field (Info-ZIP): id, size, flags, modification time in UTC
+timeExtra = struct.Struct("<2HBl")
+timeExtraId = 0x5455
+
+
+class Member:
+
+    def __init__(self, data, crc, fileSize, compressType, mode, mtime, hash=None, mtimeNs=None):
+        self.data = data
+        self.hash = hash
+        self.crc = crc
+        self.fileSize = fileSize
+        self.compressType = compressType
+        self.mode = mode
+        self.mtime = mtime
+        self.mtimeNs = mtimeNs
+
+
+def compressMember(filePath, level=-1):
+    fileStat = filePath.stat()
+    data = filePath.read_bytes()
+    hash = hashlib.sha256(data).hexdigest()
+
+    # Raw deflate stream (negative window bits), as stored in zip files. zlib releases the GIL while compressing
+    with workerSlot():
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+
+    # Incompressible content (images, archives) is stored
+    if len(compressed) >= len(data):
+        return Member(data, zlib.crc32(data), len(data), zipfile.ZIP_STORED, fileStat.st_mode, fileStat.st_mtime, hash, fileStat.st_mtime_ns)
+
+    return Member(compressed, zlib.crc32(data), len(data), zipfile.ZIP_DEFLATED, fileStat.st_mode, fileStat.st_mtime, hash, fileStat.st_mtime_ns)
+
+
+class MemberCache:
+    """
+    Compressed zip members of one build. Every file is compressed once (in a thread pool) and the compressed
+    bytes are reused by all zip files including it. Entries are keyed by path, size and mtime, so files
+    changed by the pre copies of a zip target are compressed again.
+    """
+
+    def __init__(self, jobs=None, level=-1):
+        self.jobs = getJobs(jobs)
+        self.level = level
+        self.members = {}
+        self.lock = threading.Lock()
+
+    def getKey(self, filePath):
+        fileStat = filePath.stat()
+        return (str(filePath), fileStat.st_size, fileStat.st_mtime_ns)
+
+    def compress(self, filePaths):
+        with self.lock:
+            missing = {}
+            for filePath in filePaths:
+                key = self.getKey(filePath)
+                if key not in self.members:
+                    missing[key] = filePath
+
+        if not missing:
+            return
+
+        print(f"Compressing {len(missing)} zip members with {self.jobs} jobs")
+
+        with ThreadPoolExecutor(max_workers=min(self.jobs, len(missing))) as executor:
+            members = executor.map(compressMember, missing.values(), [self.level] * len(missing))
+            for key, member in zip(missing, members):
+                with self.lock:
+                    self.members[key] = member
+
+    def get(self, filePath):
+        with self.lock:
+            return self.members[self.getKey(filePath)]
+
+
+def getDateTime(mtime, utc=False):
+    # Zip timestamps are local time with 2 second resolution, starting 1980
+    dateTime = (time.gmtime(mtime) if utc else time.localtime(mtime))[:6]
+    if dateTime[0] < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    return dateTime[:5] + (dateTime[5] // 2 * 2,)
+
+
+def crcFile(filePath):
+    crc = 0
+    with filePath.open("rb") as f:
+        while chunk := f.read(1024 * 1024):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def readRaw(zip, zinfo):
+    # Compressed data of a member as stored in the archive, without decompressing
+    zip.fp.seek(zinfo.header_offset)
+    header = localHeader.unpack(zip.fp.read(localHeader.size))
+    zip.fp.seek(header[10] + header[11], 1)
+    return zip.fp.read(zinfo.compress_size)
+
+
+def normalizeMode(mode):
+    # Regular file, executable for everybody if executable at all
+    return stat.S_IFREG | (0o755 if mode & 0o111 else 0o644)
+
+
+def getTimeExtra(mtime):
+    # The DOS timestamp is local time, the extra field keeps the UTC time for extracting
+    mtime = int(mtime)
+    if not -2**31 <= mtime < 2**31:
+        return b""
+    return timeExtra.pack(timeExtraId, timeExtra.size - 4, 1, mtime)
+
+
+def getMemberTime(zinfo):
+    # UTC time of the extended timestamp field, otherwise the local DOS timestamp
+    extra = zinfo.extra
+    while len(extra) >= 4:
+        fieldId, size = struct.unpack("<2H", extra[:4])
+        if fieldId == timeExtraId and size >= 5 and extra[4] & 1:
+            return struct.unpack("<l", extra[5:9])[0]
+        extra = extra[4 + size:]
+    return time.mktime(zinfo.date_time + (0, 0, -1))
+
+
+def writeMember(zip, name, member, dateTime=None, mode=None, mtime=None):
+    # Writes already compressed data, zipfile itself only supports compressing while writing
+    zinfo = zipfile.ZipInfo(name, dateTime or getDateTime(member.mtime))
+    zinfo.extra = getTimeExtra(member.mtime if mtime is None else mtime)
+    zinfo.compress_type = member.compressType
+    zinfo.external_attr = ((mode or member.mode) & 0xFFFF) << 16
+    if mode:
+        zinfo.create_system = 3
+    zinfo.file_size = member.fileSize
+    zinfo.compress_size = len(member.data)
+    zinfo.CRC = member.crc
+
+    zip._writecheck(zinfo)
+    zip._didModify = True
+
+    zinfo.header_offset = zip.fp.tell()
+    zip.fp.write(zinfo.FileHeader())
+    zip.fp.write(member.data)
+
+    zip.filelist.append(zinfo)
+    zip.NameToInfo[zinfo.filename] = zinfo
+    zip.start_dir = zip.fp.tell()
+
+
+def getTimesPath(zipPath):
+    return zipPath.with_name(zipPath.name + ".mtimes.json")
+
+
+def writeTimes(zipPath, entries, cache):
+    # Sidecar with the exact mtime of every source file, zip timestamps only have a resolution of 2 seconds
+    times = {}
+    for (targetName, filePath) in entries:
+        member = cache.get(filePath)
+        if member.mtimeNs is not None:
+            times[targetName] = [member.mtimeNs, member.crc]
+    timesPath = getTimesPath(zipPath)
+    tmpPath = timesPath.with_name(timesPath.name + ".tmp")
+    tmpPath.write_text(json.dumps(times, sort_keys=True))
+    tmpPath.replace(timesPath)
+
+
+def readTimes(zipPath):
+    try:
+        return json.loads(getTimesPath(zipPath).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def reuseMembers(previousPath, entries, cache):
+    # Copies the compressed data of unchanged entries (same size and exact mtime or same size and crc) into the cache
+    reused = 0
+
+    try:
+        previous = zipfile.ZipFile(previousPath)
+    except (OSError, zipfile.BadZipFile):
+        return reused
+
+    times = readTimes(previousPath)
+
+    with previous:
+        for (targetName, filePath) in entries:
+            zinfo = previous.NameToInfo.get(targetName)
+            if not zinfo or zinfo.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                continue
+
+            fileStat = filePath.stat()
+            if zinfo.file_size != fileStat.st_size:
+                continue
+
+            # The crc ties the recorded mtime to this archive, the sidecar may be older than it
+            if times.get(targetName) != [fileStat.st_mtime_ns, zinfo.CRC] and zinfo.CRC != crcFile(filePath):
+                continue
+
+            member = Member(readRaw(previous, zinfo), zinfo.CRC, zinfo.file_size, zinfo.compress_type, fileStat.st_mode,
+                            fileStat.st_mtime, mtimeNs=fileStat.st_mtime_ns)
+            with cache.lock:
+                cache.members[cache.getKey(filePath)] = member
+            reused += 1
+
+    return reused
+
+
+def getManifestEntry(hash, size, mode):
+    return {"sha256": hash, "size": size, "mode": f"{normalizeMode(mode) & 0o777:o}"}
+
+
+def writeEntryManifest(archivePath, manifest):
+    # Sidecar with the hash of every entry, clients can tell which files changed without unpacking
+    manifestPath = archivePath.with_name(archivePath.name + ".manifest.json")
+    manifestPath.write_text(json.dumps({"archive": archivePath.name, "sha256": hashFile(archivePath), "entries": manifest}, indent=2, sort_keys=True))
+
+
+def writeZip(zipPath, entries, cache, incremental=False, reproducible=False):
+    """
+    Writes (targetName, filePath) entries to zipPath with members compressed by cache (see MemberCache).
+
+    In incremental mode the compressed data of unchanged entries is copied from the previous zipPath,
+    only changed and new files are compressed. The exact mtimes of the files are kept in zipPath.mtimes.json,
+    files without a matching mtime are compared by crc.
+
+    In reproducible mode entries are sorted, all timestamps are SOURCE_DATE_EPOCH (or the commit time) and
+    permissions are normalized to 644/755, so the same inputs give the same bytes. The hashes of all entries
+    are written to zipPath.manifest.json.
+    """
+    dateTime = None
+    mtime = None
+    if reproducible:
+        entries = sorted(entries)
+        mtime = getSourceDateEpoch()
+        dateTime = getDateTime(mtime, utc=True)
+
+    if incremental and zipPath.exists():
+        reused = reuseMembers(zipPath, entries, cache)
+        print(f"Reusing {reused} of {len(entries)} members from {str(zipPath)}")
+
+    cache.compress([filePath for (targetName, filePath) in entries])
+
+    tmpPath = zipPath.with_name(zipPath.name + ".tmp")
+    with zipfile.ZipFile(tmpPath, "w") as zip:
+        for (targetName, filePath) in entries:
+            member = cache.get(filePath)
+            writeMember(zip, targetName, member, dateTime=dateTime, mode=normalizeMode(member.mode) if reproducible else None, mtime=mtime)
+    tmpPath.replace(zipPath)
+
+    if incremental:
+        writeTimes(zipPath, entries, cache)
+
+    if reproducible:
+        manifest = {}
+        for (targetName, filePath) in entries:
+            member = cache.get(filePath)
+            manifest[targetName] = getManifestEntry(member.hash or hashFile(filePath), member.fileSize, member.mode)
+        writeEntryManifest(zipPath, manifest)
+
+
+def getMemberMode(zinfo):
+    # Unix permissions (including execute) if the archive was created on Unix
+    if zinfo.create_system == 3:
+        return (zinfo.external_attr >> 16) & 0o7777
+    return 0
+
+
+def isMemberCurrent(zinfo, targetPath):
+    try:
+        fileStat = targetPath.stat()
+    except OSError:
+        return False
+
+    if fileStat.st_size != zinfo.file_size:
+        return False
+
+    # The timestamp proves nothing, all members of a reproducible archive have the same one
+    return crcFile(targetPath) == zinfo.CRC
+
+
+def extractMember(zipPath, zinfo, targetPath, local, handles):
+    # One handle per worker thread, closed by the caller when the pool is done
+    if not hasattr(local, "zip"):
+        local.zip = zipfile.ZipFile(zipPath)
+        handles.append(local.zip)
+
+    targetPath.parent.mkdir(parents=True, exist_ok=True)
+
+    # Files are replaced atomically, running programs keep their old version
+    tmpPath = targetPath.with_name(targetPath.name + ".unzip")
+    with local.zip.open(zinfo) as source, tmpPath.open("wb") as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+
+    mode = getMemberMode(zinfo)
+    if mode:
+        os.chmod(tmpPath, mode)
+
+    mtime = getMemberTime(zinfo)
+    os.utime(tmpPath, (mtime, mtime))
+    tmpPath.replace(targetPath)
+
+
+def getSafePath(name):
+    relPath = pathlib.PurePosixPath(name)
+    if relPath.is_absolute() or ".." in relPath.parts:
+        return None
+    return relPath
+
+
+def deleteStale(outputPath, members, dirs):
+    # Deletes files (and empty directories) which are not in the archive, creates the archive directories
+    deleted = 0
+    for dirPath, dirNames, fileNames in os.walk(outputPath, topdown=False):
+        relDir = pathlib.PurePosixPath(pathlib.Path(dirPath).relative_to(outputPath).as_posix())
+        for fileName in fileNames:
+            if relDir / fileName not in members:
+                os.unlink(os.path.join(dirPath, fileName))
+                deleted += 1
+        if relDir != pathlib.PurePosixPath(".") and relDir not in dirs and not os.listdir(dirPath):
+            os.rmdir(dirPath)
+
+    for dir in dirs:
+        (outputPath / dir).mkdir(parents=True, exist_ok=True)
+
+    return deleted
+
+
+def syncZip(zipPath, outputPath, jobs=None):
+    """
+    Updates outputPath in place to the content of zipPath. Only entries with a different size or crc are
+    extracted (in a thread pool), files not in the archive are deleted. Unix permissions are restored.
+    """
+    outputPath = pathlib.Path(outputPath)
+    outputPath.mkdir(parents=True, exist_ok=True)
+
+    with zipfile.ZipFile(zipPath) as zip:
+        members = {}
+        dirs = set()
+        for zinfo in zip.infolist():
+            relPath = getSafePath(zinfo.filename)
+            if relPath is None:
+                print(f"Skipping unsafe member {zinfo.filename} of {str(zipPath)}")
+                continue
+            if zinfo.is_dir():
+                dirs.add(relPath)
+            else:
+                members[relPath] = zinfo
+                dirs.update(relPath.parents)
+
+    jobs = getJobs(jobs)
+    targets = [(zinfo, outputPath / relPath) for relPath, zinfo in members.items()]
+
+    # Existing files are checksummed in the thread pool, zlib releases the GIL
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        current = list(executor.map(lambda target: isMemberCurrent(*target), targets))
+
+    changed = []
+    unchanged = 0
+    for index, (zinfo, targetPath) in enumerate(targets):
+        if current[index]:
+            mode = getMemberMode(zinfo)
+            if mode and (targetPath.stat().st_mode & 0o7777) != mode:
+                os.chmod(targetPath, mode)
+            unchanged += 1
+        else:
+            changed.append((zinfo, targetPath))
+
+    if changed:
+        local = threading.local()
+        handles = []
+        try:
+            with ThreadPoolExecutor(max_workers=min(jobs, len(changed))) as executor:
+                futures = [executor.submit(extractMember, zipPath, zinfo, targetPath, local, handles) for (zinfo, targetPath) in changed]
+                for future in futures:
+                    future.result()
+        finally:
+            for zip in handles:
+                zip.close()
+
+    deleted = deleteStale(outputPath, members, dirs)
+
+    print(f"Synced {str(outputPath)} with {str(zipPath)}: {len(changed)} extracted, {unchanged} unchanged, {deleted} deleted")
+
+
+# Tar based formats, recognized by the suffix of the archive name
+tarFormats = {
+    ".tar.zst": "zstd",
+    ".tar.xz": "xz",
+    }
+
+defaultLevels = {
+    "zstd": 19,
+    "xz": 6,
+    }
+
+
+def getArchiveFormat(archivePath):
+    name = str(archivePath)
+    for suffix, format in tarFormats.items():
+        if name.endswith(suffix):
+            return format
+    return "zip"
+
+
+def getZstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("tar.zst archives need the zstandard package (pip install rsjbuild[compress])")
+    return zstandard
+
+
+def compressBlock(data, format, level):
+    # Every block is a complete xz stream or zstd frame, lzma and zstandard release the GIL while compressing
+    with workerSlot():
+        if format == "xz":
+            return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+        return getZstandard().ZstdCompressor(level=level, write_content_size=True).compress(data)
+
+
+class BlockWriter:
+    """
+    Write only file object compressing its data in independent blocks on a thread pool. The concatenated
+    blocks are a valid .xz (multiple streams) or .zst (multiple frames) file, decompressed by the standard tools.
+    """
+
+    def __init__(self, file, format, level, jobs=None, blockSize=16 * 1024 * 1024):
+        self.file = file
+        self.format = format
+        self.level = level
+        self.blockSize = blockSize
+        self.jobs = getJobs(jobs)
+
+        self.buffer = bytearray()
+        self.pending = collections.deque()
+        self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.blockSize:
+            self.submit(bytes(self.buffer[:self.blockSize]))
+            del self.buffer[:self.blockSize]
+        return len(data)
+
+    def submit(self, block):
+        self.pending.append(self.executor.submit(compressBlock, block, self.format, self.level))
+
+        # Blocks are written in order, at most two blocks per worker are kept in memory
+        while len(self.pending) > 2 * self.jobs:
+            self.file.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.buffer:
+            self.submit(bytes(self.buffer))
+            self.buffer = bytearray()
+
+        while self.pending:
+            self.file.write(self.pending.popleft().result())
+
+        self.executor.shutdown()
+
+
+def writeTar(tarPath, entries, level=None, jobs=None, reproducible=False, blockSize=16):
+    """
+    Writes (targetName, filePath) entries to a .tar.zst or .tar.xz file, compressed in parallel blocks of
+    blockSize MB. Reproducible mode works as for writeZip (sorted entries, fixed timestamps and owners,
+    normalized permissions and a manifest with the hashes of all entries).
+    """
+    format = getArchiveFormat(tarPath)
+    if format == "zip":
+        raise ValueError(f"Unknown tar format of {str(tarPath)}")
+
+    if level is None:
+        level = defaultLevels[format]
+
+    mtime = None
+    if reproducible:
+        entries = sorted(entries)
+        mtime = getSourceDateEpoch()
+
+    manifest = {}
+
+    tmpPath = tarPath.with_name(tarPath.name + ".tmp")
+    with tmpPath.open("wb") as file:
+        writer = BlockWriter(file, format, level, jobs=jobs, blockSize=int(blockSize * 1024 * 1024))
+
+        # Symbolic links (e.g. bin/python of a venv) are stored as the files they point to, as in zip files
+        with tarfile.open(fileobj=writer, mode="w|", format=tarfile.PAX_FORMAT, dereference=True) as tar:
+            for (targetName, filePath) in entries:
+                tarinfo = tar.gettarinfo(filePath, arcname=targetName)
+
+                if reproducible:
+                    tarinfo.mtime = mtime
+                    tarinfo.uid = tarinfo.gid = 0
+                    tarinfo.uname = tarinfo.gname = ""
+
+                if not tarinfo.isreg():
+                    tar.addfile(tarinfo)
+                    continue
+
+                if reproducible:
+                    tarinfo.mode = normalizeMode(tarinfo.mode) & 0o777
+                    manifest[targetName] = getManifestEntry(hashFile(filePath), tarinfo.size, tarinfo.mode)
+
+                with filePath.open("rb") as f:
+                    tar.addfile(tarinfo, f)
+
+        writer.close()
+
+    tmpPath.replace(tarPath)
+
+    if reproducible:
+        writeEntryManifest(tarPath, manifest)
+
+
+@contextlib.contextmanager
+def openTar(tarPath):
+    # Streams of multi block archives are read with decompressors handling concatenated streams and frames
+    if getArchiveFormat(tarPath) == "xz":
+        with tarfile.open(tarPath, "r:xz") as tar:
+            yield tar
+        return
+
+    zstandard = getZstandard()
+    with open(tarPath, "rb") as file:
+        with zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True) as reader:
+            with tarfile.open(fileobj=reader, mode="r|") as tar:
+                yield tar
+
+
+def extractTar(tarPath, outputPath):
+    with openTar(tarPath) as tar:
+        tar.extractall(outputPath, filter="data")
+
+
+def spoolMember(source, targetPath, size, chunkSize=1024 * 1024):
+    """
+    Compares the member stream source chunk by chunk with targetPath. Returns None if they are equal, otherwise the
+    content as bytes if it fits into one chunk, or the path of a temporary file next to targetPath holding it.
+    """
+    try:
+        fileStat = os.lstat(targetPath)
+        target = open(targetPath, "rb") if stat.S_ISREG(fileStat.st_mode) and fileStat.st_size == size else None
+    except OSError:
+        target = None
+
+    offset = 0
+    chunk = b""
+    with target or contextlib.nullcontext():
+        if target:
+            while chunk := source.read(chunkSize):
+                if target.read(len(chunk)) != chunk:
+                    break
+                offset += len(chunk)
+            else:
+                return None
+        else:
+            chunk = source.read(chunkSize)
+
+        if size <= chunkSize:
+            return chunk + source.read()
+
+        # The equal start is taken from the target, the stream cannot be read again
+        targetPath.parent.mkdir(parents=True, exist_ok=True)
+        tmpPath = targetPath.with_name(targetPath.name + ".untar")
+        with tmpPath.open("wb") as output:
+            if offset:
+                target.seek(0)
+                output.write(target.read(offset))
+            output.write(chunk)
+            shutil.copyfileobj(source, output, chunkSize)
+    return tmpPath
+
+
+def writeFile(targetPath, data, mode, mtime):
+    targetPath.parent.mkdir(parents=True, exist_ok=True)
+
+    if isinstance(data, pathlib.Path):
+        tmpPath = data
+    else:
+        tmpPath = targetPath.with_name(targetPath.name + ".untar")
+        tmpPath.write_bytes(data)
+    os.chmod(tmpPath, mode)
+    os.utime(tmpPath, (mtime, mtime))
+    tmpPath.replace(targetPath)
+
+
+def isInside(rootPath, path):
+    # The real path, symbolic links created by earlier members must not lead out of rootPath
+    realPath = os.path.realpath(path)
+    return realPath == rootPath or realPath.startswith(rootPath + os.sep)
+
+
+def syncTar(tarPath, outputPath, jobs=None, maxPending=64 * 1024 * 1024):
+    """
+    Updates outputPath in place to the content of a .tar.zst or .tar.xz file (see syncZip). Tar entries have no
+    checksum, so the content of files with the same size is compared while streaming. Members below a symbolic link leading out
+    of outputPath and links to absolute paths or outside of outputPath are skipped.
+    """
+    outputPath = pathlib.Path(outputPath)
+    outputPath.mkdir(parents=True, exist_ok=True)
+    rootPath = os.path.realpath(outputPath)
+
+    members = set()
+    dirs = set()
+    extracted = 0
+    unchanged = 0
+
+    jobs = getJobs(jobs)
+
+    with openTar(tarPath) as tar, ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = collections.deque()
+        pending = 0
+
+        for member in tar:
+            relPath = getSafePath(member.name)
+            if relPath is None:
+                print(f"Skipping unsafe member {member.name} of {str(tarPath)}")
+                continue
+
+            if member.isdir():
+                dirs.add(relPath)
+                continue
+
+            if not (member.isreg() or member.issym()):
+                continue
+
+            targetPath = outputPath / relPath
+
+            if not isInside(rootPath, targetPath.parent):
+                print(f"Skipping member {member.name} of {str(tarPath)} below a link out of {str(outputPath)}")
+                continue
+
+            if member.issym() and (os.path.isabs(member.linkname) or not isInside(rootPath, targetPath.parent / member.linkname)):
+                print(f"Skipping link {member.name} -> {member.linkname} of {str(tarPath)} pointing out of {str(outputPath)}")
+                continue
+
+            members.add(relPath)
+            dirs.update(relPath.parents)
+
+            if member.issym():
+                if targetPath.is_symlink() and os.readlink(targetPath) == member.linkname:
+                    unchanged += 1
+                    continue
+                targetPath.parent.mkdir(parents=True, exist_ok=True)
+                targetPath.unlink(missing_ok=True)
+                os.symlink(member.linkname, targetPath)
+                extracted += 1
+                continue
+
+            # The data has to be read in stream order, small files are written by the workers
+            data = spoolMember(tar.extractfile(member), targetPath, member.size)
+            mode = member.mode & 0o777
+
+            if data is None:
+                if (targetPath.stat().st_mode & 0o777) != mode:
+                    os.chmod(targetPath, mode)
+                unchanged += 1
+                continue
+
+            size = len(data) if isinstance(data, bytes) else 0
+            futures.append((executor.submit(writeFile, targetPath, data, mode, member.mtime), size))
+            pending += size
+            extracted += 1
+
+            # Limits the data of pending writes kept in memory
+            while pending > maxPending:
+                future, size = futures.popleft()
+                future.result()
+                pending -= size
+
+        for future, size in futures:
+            future.result()
+
+    deleted = deleteStale(outputPath, members, dirs)
+
+    print(f"Synced {str(outputPath)} with {str(tarPath)}: {extracted} extracted, {unchanged} unchanged, {deleted} deleted")
@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import shlex
+import pathlib
+import statistics
+import subprocess
+import tempfile
+import sysconfig
+import logging
+
+logger = logging.getLogger(__name__)
+
+import addict
+
+
+def findExecutable(exeName):
+    if sys.platform == "win32":
+        candidates = [pathlib.Path("embed") / f"{exeName}.exe", pathlib.Path("build") / f"{exeName}.exe"]
+    else:
+        candidates = [pathlib.Path("embed/bin") / exeName, pathlib.Path("build") / exeName]
+
+    for candidate in candidates:
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def runOnce(cmd, env=None):
+    # Returns wall time in seconds and peak RSS in kB (None where the platform does not report it)
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    if hasattr(os, "wait4"):
+        _, status, rusage = os.wait4(process.pid, 0)
+        wallTime = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        maxRss = rusage.ru_maxrss
+        if sys.platform == "darwin":
+            maxRss //= 1024
+    else:
+        process.wait()
+        wallTime = time.perf_counter() - start
+        maxRss = None
+
+    if process.returncode:
+        print(f"Warning: {' '.join(cmd)} exited with {process.returncode}")
+
+    return wallTime, maxRss
+
+
+def countModules(cmd):
+    # One extra instrumented run, so the timed runs are not affected by the import time recorder
+    with tempfile.TemporaryDirectory() as tmpDir:
+        outputPath = pathlib.Path(tmpDir) / "importtime.json"
+        env = dict(os.environ, RSJBUILD_IMPORTTIME=str(outputPath))
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            data = json.loads(outputPath.read_text())
+        except Exception:
+            return None
+    return {"modules": data.get("sysModules"), "compiledModules": len(data.get("modules", []))}
+
+
+def getEvictPaths(exePath, extraPaths=[]):
+    # Files read at startup: the executable, the embedded environment, the standard library and libpython
+    paths = [exePath, pathlib.Path("embed")]
+    for name in ("stdlib", "platstdlib"):
+        paths.append(pathlib.Path(sysconfig.get_paths()[name]))
+    libDir = sysconfig.get_config_var("LIBDIR")
+    if libDir:
+        paths += list(pathlib.Path(libDir).glob("libpython*"))
+    return paths + [pathlib.Path(path) for path in extraPaths]
+
+
+def evictFiles(paths):
+    """
+    Drops the cached pages of all files below paths from the page cache, so the next run reads them from disk.
+    """
+    filePaths = []
+    for path in dict.fromkeys(paths):
+        if path.is_dir():
+            for dirPath, dirNames, fileNames in os.walk(path):
+                filePaths += [os.path.join(dirPath, fileName) for fileName in fileNames]
+        elif path.exists():
+            filePaths.append(str(path))
+
+    for filePath in filePaths:
+        try:
+            fd = os.open(filePath, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def getColdStart(exePath, bench):
+    # Returns a function evicting the startup files before a cold run, or None if it is not possible here
+    if bench.dropCaches:
+        return lambda: subprocess.run(bench.dropCaches, shell=True, check=True)
+
+    if hasattr(os, "posix_fadvise"):
+        paths = getEvictPaths(exePath, bench.evict or [])
+        return lambda: evictFiles(paths)
+
+    return None
+
+
+def benchExecutable(exePath, args, runs, coldRuns=3, coldStart=None):
+    cmd = [str(exePath.resolve())] + args
+
+    # Cold runs read the executable and libraries from disk, the warm runs follow from the page cache
+    coldResults = []
+    if coldStart:
+        for i in range(coldRuns):
+            coldStart()
+            coldResults.append(runOnce(cmd))
+
+    results = [runOnce(cmd) for i in range(max(runs, 2))]
+
+    coldTimes = [wallTime for (wallTime, maxRss) in coldResults]
+    warmTimes = [wallTime for (wallTime, maxRss) in results[1:]]
+    rssValues = [maxRss for (wallTime, maxRss) in coldResults + results if maxRss is not None]
+
+    result = {
+        "cold": statistics.median(coldTimes) if coldTimes else None,
+        "coldRuns": len(coldTimes),
+        "warm": statistics.median(warmTimes),
+        "warmMin": min(warmTimes),
+        "maxRss": max(rssValues) if rssValues else None,
+        "runs": len(results),
+        }
+    result.update(countModules(cmd) or {})
+    return result
+
+
+def compareBaseline(results, baseline, threshold, coldThreshold):
+    # Cold starts depend on the disk and vary more, they have their own threshold
+    regressions = []
+    for exeName, result in results.items():
+        if exeName not in baseline:
+            continue
+        for metric, metricThreshold in (("cold", coldThreshold), ("warm", threshold), ("maxRss", threshold), ("modules", threshold)):
+            current = result.get(metric)
+            previous = baseline[exeName].get(metric)
+            if current is None or not previous:
+                continue
+            change = 100.0 * (current - previous) / previous
+            if change > metricThreshold:
+                regressions.append(f"{exeName} {metric}: {previous:.4g} -> {current:.4g} (+{change:.1f}%)")
+    return regressions
+
+
+def bench(parms, config):
+    config = addict.Dict(config)
+
+    runs = parms.runs or config.bench.runs or 10
+    threshold = parms.threshold if parms.threshold is not None else (config.bench.threshold or 10.0)
+    coldThreshold = parms.coldThreshold if parms.coldThreshold is not None else (config.bench.coldThreshold or 25.0)
+    coldRuns = parms.coldRuns if parms.coldRuns is not None else config.bench.coldRuns
+    baselinePath = pathlib.Path(parms.baseline or config.bench.baseline or "bench.json")
+
+    results = {}
+
+    for exeName, compileArgs in config.compile.items():
+        if "onlyOn" in compileArgs:
+            if sys.platform not in compileArgs.onlyOn:
+                continue
+
+        exePath = findExecutable(exeName)
+        if exePath is None:
+            print(f"{exeName}: executable not found, skipping")
+            continue
+
+        if parms.args is not None:
+            args = shlex.split(parms.args)
+        else:
+            args = list(config.bench.args.get(exeName, []))
+
+        coldStart = getColdStart(exePath, config.bench)
+        if coldStart is None and coldRuns:
+            print("Cold starts need posix_fadvise or a dropCaches command in the bench configuration, skipping them")
+
+        print(f"Benchmarking {str(exePath)} {' '.join(args)} ({coldRuns if coldStart else 0} cold, {runs} warm runs)")
+        results[exeName] = benchExecutable(exePath, args, runs, coldRuns=coldRuns, coldStart=coldStart)
+
+    print(f"{'executable':20s} {'cold [ms]':>10s} {'warm [ms]':>10s} {'peak RSS [kB]':>14s} {'modules':>8s}")
+    for exeName, result in results.items():
+        cold = f"{result['cold'] * 1000:.1f}" if result["cold"] is not None else "-"
+        maxRss = result["maxRss"] if result["maxRss"] is not None else "-"
+        modules = result.get("modules") if result.get("modules") is not None else "-"
+        print(f"{exeName:20s} {cold:>10} {result['warm'] * 1000:10.1f} {maxRss:>14} {modules:>8}")
+
+    pathlib.Path("build").mkdir(parents=True, exist_ok=True)
+    pathlib.Path("build/bench.json").write_text(json.dumps(results, indent=2))
+
+    if parms.updateBaseline:
+        baselinePath.write_text(json.dumps(results, indent=2))
+        print(f"Baseline written to {str(baselinePath)}")
+        return
+
+    if baselinePath.exists():
+        regressions = compareBaseline(results, json.loads(baselinePath.read_text()), threshold, coldThreshold)
+        if regressions:
+            print(f"Startup regressions above {threshold}% (cold {coldThreshold}%):")
+            print("\n".join(regressions))
+            sys.exit(1)
+        print(f"No regressions above {threshold}% (cold {coldThreshold}%) against {str(baselinePath)}")
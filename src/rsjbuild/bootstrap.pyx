@@ -1,4 +1,6 @@
 import sys
+import os
+import time
 import importlib.machinery
 import logging
 
@@ -19,12 +21,36 @@ cdef extern from "{{package}}.h":
     object PyInit_{{module}}()
 {% endfor %}
 
+# Fully qualified module name to module init function, generated at build time. Modules of packages are
+# found by their bare name as well
 definitions = {
 {% for module in modules %}
     "{{module}}": PyInit_{{module}},
+{% if package != "__main__" %}
+    "{{package}}.{{module}}": PyInit_{{module}},
+{% endif %}
 {% endfor %}
     }
 
+# Import time recording, shared by all bootstrap modules of the executable through sys
+importTimes = None
+
+def writeImportTimes():
+    import json
+    with open(importTimes["output"], "w") as f:
+        json.dump({"executable": sys.executable, "argv": sys.argv, "sysModules": len(sys.modules), "modules": importTimes["modules"]}, f, indent=1)
+
+def setupImportTimes():
+    global importTimes
+    importTimes = getattr(sys, "_rsjbuildImportTimes", None)
+    if importTimes is None and package == "__main__":
+        outputPath = os.environ.get("RSJBUILD_IMPORTTIME"{% if importTime %}, "importtime.json"{% endif %})
+        if outputPath:
+            importTimes = {"output": outputPath, "start": time.perf_counter(), "modules": [], "stack": []}
+            sys._rsjbuildImportTimes = importTimes
+            import atexit
+            atexit.register(writeImportTimes)
+
 def debugMsg(*args):
     {% if debug %}
     print(*args)
@@ -35,13 +61,19 @@ def debugMsg(*args):
 cdef class CythonPackageLoader:
     cdef PyModuleDef* definition
     cdef object def_o
+    cdef object init
     cdef str name
+    cdef double createTime
+
+    def __init__(self, fullname):
+        # Only remembers the init function, find_spec must stay cheap
+        debugMsg("Create CythonPackageLoader", fullname)
+        self.init = definitions[fullname]
+        self.name = fullname.rpartition(".")[2]
 
-    def __init__(self, name):
-        debugMsg("Create CythonPackageLoader", name)
-        self.def_o = definitions[name] ()
+    cdef initDef(self):
+        self.def_o = self.init()
         self.definition = <PyModuleDef*>self.def_o
-        self.name = name
         Py_INCREF(self.def_o)
 
     def load_module(self, fullname):
@@ -50,14 +82,40 @@ cdef class CythonPackageLoader:
 
     def create_module(self, spec):
         debugMsg(package, self.name, "create_module", spec)
-        if package != "__main__":
-            if spec.name.split(".")[-1] != self.name:
-                raise ImportError()
+        if importTimes is None:
+            self.initDef()
+            return PyModule_FromDefAndSpec(self.definition, spec)
+
+        start = time.perf_counter()
+        self.initDef()
         module = PyModule_FromDefAndSpec(self.definition, spec)
+        self.createTime = time.perf_counter() - start
 
         return module
 
     def exec_module(self, module):
+        if importTimes is None:
+            self.execDef(module)
+            return
+
+        stack = importTimes["stack"]
+        record = {
+            "name": module.__name__,
+            "parent": stack[-1] if stack else None,
+            "depth": len(stack),
+            "start": time.perf_counter() - importTimes["start"],
+            "create": self.createTime,
+            }
+        stack.append(module.__name__)
+
+        start = time.perf_counter()
+        self.execDef(module)
+        record["exec"] = time.perf_counter() - start
+
+        stack.pop()
+        importTimes["modules"].append(record)
+
+    cdef execDef(self, module):
         try:
             PyModule_ExecDef(module, self.definition)
             module.__file__ = f"{sys.executable}/{self.name}"
@@ -65,41 +123,32 @@ cdef class CythonPackageLoader:
             logger.exception("Exception")
 
 class CythonPackageMetaPathFinder:
-    def __init__(self, modules_set):
-        self.modules_set = modules_set
+    # Runs for every import in the process, so a miss is a single dict probe without allocations
 
     def find_spec(self, fullname, path, target=None):
+        {% if debug %}
         debugMsg(package, "find_spec", fullname, path)
-        nameParts = fullname.split(".")
-
-        if package == "__main__":
-            if len(nameParts) > 1:
-                return None
-        else:
-            if len(nameParts) > 1:
-
-                if nameParts[-2] != package:
-                    return None
-
-        namePart = nameParts[-1]
-
-        if namePart not in self.modules_set:
+        {% endif %}
+        if fullname not in definitions:
             return None
-        return importlib.machinery.ModuleSpec(fullname, CythonPackageLoader(namePart))
+        return importlib.machinery.ModuleSpec(fullname, CythonPackageLoader(fullname))
 
     def invalidate_caches(self):
         pass
 
 def bootstrap_cython_submodules():
     debugMsg(package, "bootstrap_cython_submodules")
-    modules_set = {{modules}}
-    sys.meta_path.insert(0, CythonPackageMetaPathFinder(modules_set))
-    #sys.meta_path.append(CythonPackageMetaPathFinder(modules_set))
+    sys.meta_path.insert(0, CythonPackageMetaPathFinder())
 
+setupImportTimes()
 bootstrap_cython_submodules()
 
 {% if mainModule %}
 sys.frozen = True
+{% if libraryZip %}
+# Precompiled bytecode archive appended to the executable
+sys.path.insert(0, sys.executable)
+{% endif %}
 import {{mainModule}}
 {{mainModule}}.main()
 {%else %}
@@ -7,9 +7,8 @@ import json
 import os
 import os.path
 import zipfile
-import gzip
 import subprocess
-from contextlib import chdir
+import functools
 
 from Cython.Compiler.ExprNodes import NoneNode
 
@@ -18,70 +17,53 @@ logger = logging.getLogger(__file__)
 import addict
 
 from .getversion import getVersion, setVersion
-from .embedded import createEmbedded, doCopyFiles
+from .embedded import createEmbedded, compileBytecode, doCopyFiles
 from .installer import createInstaller, publishInstaller
-from .compile import compile
+from .optimize import compileOptimized
+from .annotate import annotate
+from .objectcache import ObjectCache
 from .language import procMessages
+from .compress import precompress
+from .archive import MemberCache, writeZip, syncZip, writeTar, extractTar, syncTar, getArchiveFormat
+from .scanner import scanner, scanTree, invalidate
+from .copyengine import CopyEngine
 from .upload import upload
-from .utils import pythonCall
+from .scheduler import Scheduler
+from .buildtrace import tracer, span, shortCommand
+from .utils import pythonCall, replaceFile
 
-def system(cmd):
+def system(cmd, cwd=None):
+    # The build tasks run concurrently, so the working directory is passed to the subprocess instead of chdir
     print(cmd)
-    subprocess.run(cmd, shell=True, check=True)
+    with span(shortCommand(cmd), "subprocess", command=cmd, cwd=str(cwd or ".")) as args:
+        result = subprocess.run(cmd, shell=True, cwd=cwd)
+        args["exitCode"] = result.returncode
+    result.check_returncode()
 
-def doCopy(options):
+def doCopy(options, engine=None, bytecode=None, jobs=None):
     if options:
         createDirs = options.get("createDirs", [])
         copyFiles = options.get("copyFiles", [])
         copyTrees = options.get("copyTrees", [])
         deleteFiles = options.get("deleteFiles", [])
 
-        doCopyFiles(pathlib.Path("embed"), pathlib.Path("."), createDirs=createDirs, copyFiles=copyFiles, copyTrees=copyTrees, deleteFiles=deleteFiles)
-
-def inPatternList(filePath, ignoreList):
-    for ignorePattern in ignoreList:
-        if filePath.match(ignorePattern):
-            return True
-    return False
-
-def build(parms, config):
-
-    config = addict.Dict(config)
-
-    basePath = pathlib.Path(".")
-
-    for name, content in config.base64Decode.items():
-        content = os.environ.get(content)
-        if content:
-            content = content.encode("utf-8")
-            content = base64.b64decode(content)
-            targetPath = basePath / name
-            targetPath.write_bytes(content)
-            print(f"Decoded {name}")
+        embedPath = pathlib.Path("embed")
 
-    version = getVersion()
+        doCopyFiles(embedPath, pathlib.Path("."), createDirs=createDirs, copyFiles=copyFiles, copyTrees=copyTrees, deleteFiles=deleteFiles, engine=engine)
+        invalidate("embed")
 
-    buildPath = basePath / "build"
-    buildPath.mkdir(parents=True, exist_ok=True)
+        # Unchecked hash pycs are never revalidated, Python files copied after the bytecode stage are compiled again
+        if bytecode and bytecode.enabled:
+            for fileName in copyFiles:
+                target = fileName if isinstance(fileName, str) else fileName[1]
+                if target.endswith(".py"):
+                    compileBytecode(embedPath / target, optimize=bytecode.optimize)
 
-    outputPath = basePath / "output"
-    outputPath.mkdir(parents=True, exist_ok=True)
-
-    embedPath = basePath / "embed"
-    embedPath.mkdir(parents=True, exist_ok=True)
-
-    if parms.buildEmbed:
-        createEmbedded(embedPath,
-                       exeName=config.exeName,
-                       createDirs=config.createDirs,
-                       copyTrees=config.copyTrees,
-                       copyFiles=config.copyFiles,
-                       deleteFiles=config.deleteFiles,
-                       compModules=config.compModules,
-                       buildPath=buildPath,
-                       includeTkinter=config.withTkinter,
-                       removeTests=False)
+            for tree in copyTrees:
+                target = tree if isinstance(tree, str) else tree[1]
+                compileBytecode(embedPath / target, optimize=bytecode.optimize, jobs=jobs)
 
+def applyTemplates(config, basePath, embedPath):
     for secretEnv, files in config.template.items():
         if secretEnv in os.environ:
             secrets = os.environ[secretEnv]
@@ -93,225 +75,378 @@ def build(parms, config):
                 text = templatePath.read_text()
                 for secret, value in secrets.items():
                     text = text.replace(f"${{{secret}}}", value)
-                targetPath.write_text(text)
+                replaceFile(targetPath, text)
+
+def getBinPath():
+    embedPath = pathlib.Path("embed")
+    if sys.platform == "win32":
+        return embedPath
+    return embedPath / "bin"
+
+def installExecutables(exePaths):
+    binPath = getBinPath()
+    binPath.mkdir(parents=True, exist_ok=True)
+    for exePath in exePaths.values():
+        tmpPath = binPath / (exePath.name + ".tmp")
+        shutil.copy(exePath, tmpPath)
+        os.replace(tmpPath, binPath / exePath.name)
+
+def copyLocale(engine):
+    if pathlib.Path("locale").exists():
+        engine.copyTree("locale", "embed/locale", ignore=["*.po"], delete=True)
+
+def buildUserguide(dir):
+    pythonPath = pathlib.Path(sys.executable).parent
+    mkDocs = str(pythonPath / "mkdocs")
+    system(f"{mkDocs} build", cwd=dir)
+
+def copyUserguide(dir, targetPath, engine):
+    engine.copyTree(dir / "site", targetPath / dir.name / "site", delete=True)
+
+def buildPnpm(directory):
+    system("pnpm i", cwd=directory)
+    system("pnpm run build", cwd=directory)
+
+def buildRequire(source, prepare):
+    pythonCall(prepare)
+    buildPnpm(source)
+
+def addWebTasks(scheduler, config, buildPath, jobs=None, deps=[]):
+    """
+    Adds the pnpm, require and precompress tasks to scheduler. The outputs of bundlers are not declared (they may
+    write into embed), so pnpm and require run after deps (the tasks creating embed) and precompress after them.
+    """
+    pnpmTasks = []
+    for directory in config.pnpm:
+        pnpmTasks.append(scheduler.add(f"pnpm:{directory}", functools.partial(buildPnpm, directory), deps=deps, outputs=[directory]))
+
+    requireTasks = []
+    for source, prepare in config.require.items():
+        requireTasks.append(scheduler.add(f"require:{source}",
+                                          functools.partial(buildRequire, source, prepare),
+                                          deps=deps + pnpmTasks,
+                                          outputs=[source, "buildout", "buildcss"]))
+
+    if config.gzip:
+        scheduler.add("precompress",
+                      functools.partial(precompress, config.gzip, config.precompress, buildPath=buildPath, jobs=jobs),
+                      deps=pnpmTasks + requireTasks,
+                      inputs=config.gzip,
+                      outputs=config.gzip + [buildPath / "precompress.json"])
+
+    return pnpmTasks + requireTasks
+
+def createInstallers(parms, config, version, engine):
+    installerSourceDirPath = pathlib.Path("install")
+    installerOutputDirPath = pathlib.Path("output")
+
+    for (output, options) in config.installers.items():
+
+        doCopy(options.pre, engine, bytecode=config.bytecode, jobs=parms.jobs)
+
+        installerSourcePath = installerSourceDirPath / options.source
+        installerPath = installerOutputDirPath / output
+
+        certificatePath = None
+        if "certificatePath" in config:
+            certificatePath = pathlib.Path(config.certificatePath)
+
+        codesigningKey = None
+        if "codesigningKey" in config:
+            codesigningKey = config.codesigningKey
+
+        createInstaller(installerSourcePath,
+                        installerPath,
+                        options.title,
+                        version,
+                        sign=parms.sign,
+                        innoSetupPath=pathlib.Path(config.innoSetupPath),
+                        signTool=config.signTool,
+                        codesigningKey=codesigningKey,
+                        certificatePath =certificatePath,
+                        timestampUrl=config.timestampUrl,
+                        additionalParms=options.get("additionalParms", {}))
+
+        doCopy(options.post, engine, bytecode=config.bytecode, jobs=parms.jobs)
+
+def createZips(config, engine, jobs=None):
+    print("Creating zip files")
+
+    # Files included by several zip files are compressed only once
+    cache = MemberCache(jobs)
+
+    for (output, options) in config.zips.items():
+
+        doCopy(options.pre, engine, bytecode=config.bytecode, jobs=jobs)
+
+        prefixPath = pathlib.Path(config.exeName)
+        zipPath = pathlib.Path("output") / output
+        embedPath = pathlib.Path("embed")
 
-    sourcePath = basePath / config.sourcePath
+        included = set()
 
-    setVersion(sourcePath, config.exeName)
+        print(f"Creating {str(zipPath)}")
 
-    if "embedData" in config:
-        for (k, v) in config.embedData.items():
-            target = sourcePath / k
-            sourceData = pathlib.Path(v)
+        entries = []
 
-            data = json.loads(sourceData.read_text())
-            data = f"{target.stem} = {json.dumps(data, indent=2)}\n"
+        # Ignored directories are not entered, their whole subtree is left out
+        for filePath in scanTree(embedPath, ignore=options.get("ignore", [])):
+            targetName = str(prefixPath / filePath.relative_to(embedPath))
+            included.add(targetName)
+            entries.append((targetName, filePath))
 
-            target.write_text(data)
+        if "extra" in options:
+            extra = json.loads(pathlib.Path(options.extra).read_text())
+            extra = addict.Dict(extra)
 
-    for exeName, compileArgs in config.compile.items():
+            for fileName in extra.fileList:
+                filePath = pathlib.Path(fileName)
+                targetName = str(prefixPath / filePath)
+                if targetName not in included:
+                    included.add(targetName)
+                    entries.append((targetName, filePath))
 
-        if "onlyOn" in compileArgs:
-            if sys.platform not in compileArgs.onlyOn:
-                continue
+            for dirName in extra.dirList:
+                for filePath in scanTree(dirName):
+                    targetName = str(prefixPath / filePath)
+                    if targetName not in included:
+                        included.add(targetName)
+                        entries.append((targetName, filePath))
 
-        exePath = compile(sourcePath,
-                          exeName,
-                          compileArgs.mainModule,
-                          compileArgs.sources,
-                          noConsole=compileArgs.noConsole,
-                          force=parms.force)
-
-        embedPath = pathlib.Path("embed")
-
-        if sys.platform == "win32":
-            binPath = embedPath
-            shutil.copy(exePath, embedPath)
+        if getArchiveFormat(zipPath) == "zip":
+            writeZip(zipPath, entries, cache, incremental=options.get("incremental", False), reproducible=options.get("reproducible", False))
         else:
-            binPath = embedPath / "bin"
+            writeTar(zipPath, entries, level=options.get("level"), jobs=jobs, reproducible=options.get("reproducible", False), blockSize=options.get("blockSize", 16))
 
-        binPath.mkdir(parents=True, exist_ok=True)
-        shutil.copy(exePath, binPath)
+        doCopy(options.post, engine, bytecode=config.bytecode, jobs=jobs)
 
-    procMessages(config.sourcePath, config.exeName)
+def unzipAll(config, jobs=None):
+    for (output, source) in config.unzip:
+        format = getArchiveFormat(source)
 
-    if pathlib.Path("locale").exists():
-        pathlib.Path("embed/locale").mkdir(parents=True, exist_ok=True)
-        shutil.copytree("locale", "embed/locale", ignore=shutil.ignore_patterns("*.po"), dirs_exist_ok=True)
+        if config.unzipSync:
+            if format == "zip":
+                syncZip(source, output, jobs=jobs)
+            else:
+                syncTar(source, output, jobs=jobs)
+            continue
 
-    if "userguide" in config:
+        outputPath = pathlib.Path(output)
+        shutil.rmtree(outputPath, ignore_errors=True)
+        outputPath.mkdir(parents=True, exist_ok=True)
 
-        pythonPath = pathlib.Path(sys.executable).parent
+        if format != "zip":
+            extractTar(source, outputPath)
+            continue
 
-        mkDocs = str(pythonPath / "mkdocs")
+        with zipfile.ZipFile(source) as zipFile:
+            for member in zipFile.infolist():
+                extracted_path = zipFile.extract(member, outputPath)
 
-        userguidePath = pathlib.Path(config.userguide)
-        targetPath = pathlib.Path("embed") / config.userguide
+                # Restore file permissions (including execute) if created on Unix
+                if member.create_system == 3:
+                    unix_mode = member.external_attr >> 16
+                    if unix_mode:
+                        os.chmod(extracted_path, unix_mode)
 
-        for dir in userguidePath.glob("*"):
-            with chdir(dir):
-                system(f"{mkDocs} build")
+def uploadAll(parms, config, version, basePath):
+    if parms.publish:
 
-            targetDirPath = targetPath / dir.name
-            targetDirPath.mkdir(parents=True, exist_ok=True)
-            shutil.copytree(dir / "site", targetDirPath / "site", dirs_exist_ok=True)
+        for installer, options in config.installers.items():
 
-    if "pnpm" in config:
-        for directory in config.pnpm:
-            with chdir(directory):
-                os.environ["NODE_OPTIONS"] = "--max-old-space-size=8192"
-                system("pnpm i")
-                system("pnpm run build")
+            installerPath = pathlib.Path("output") / installer
+            versionPath = pathlib.Path("output") / options.currentVersion
 
-    pathlib.Path("buildout").mkdir(exist_ok=True, parents=True)
-    pathlib.Path("buildcss").mkdir(exist_ok=True, parents=True)
+            publishInstaller(installerPath,
+                             version,
+                             downloadUrl=options.downloadUrl,
+                             installArgs=config.installArgs,
+                             updateInterval=config.updateInterval,
+                             keytoolConfigPath=basePath / "keytool.json",
+                             versionPath=versionPath)
 
-    if "require" in config:
+    if config.uploadHost and config.uploadHost != "$(UPLOAD_HOST}" and config.uploadHost != " " :
+        upload(config.upload, version, config.uploadPrefix)
 
-        for source, prepare in config.require.items():
-            pythonCall(prepare)
-            with chdir(source):
-                system("pnpm i")
-                system("pnpm run build")
+def build(parms, config):
+    tracer.clear()
+    scanner.clear()
+    try:
+        runBuild(parms, config)
+    finally:
+        tracePath = pathlib.Path("build") / "trace.json"
+        tracer.write(tracePath)
+        print(tracer.summary(parms.traceTop))
+        print(f"Build trace written to {str(tracePath)}")
+
+def runBuild(parms, config):
 
-    if "gzip" in config:
-        for source in config.gzip:
-            sourcePath = pathlib.Path(source)
-
-            for filePath in sourcePath.glob("**/*"):
-                if filePath.is_file():
-                    if filePath.suffix in [".gz", ".zip", ".png", ".gif", ".jpg", ".jpeg"]:
-                        continue
+    config = addict.Dict(config)
 
-                    with gzip.open(str(filePath)+".gz", "wb") as gzipFile:
-                        with filePath.open("rb") as file:
-                            shutil.copyfileobj(file, gzipFile)
+    basePath = pathlib.Path(".")
 
-    doCopy(config.lateCopy)
+    for name, content in config.base64Decode.items():
+        content = os.environ.get(content)
+        if content:
+            content = content.encode("utf-8")
+            content = base64.b64decode(content)
+            targetPath = basePath / name
+            targetPath.write_bytes(content)
+            print(f"Decoded {name}")
 
-    if parms.withInstaller:
+    version = getVersion()
 
-        if sys.platform == "win32":
-            installerSourceDirPath = pathlib.Path("install")
-            installerOutputDirPath = pathlib.Path("output")
+    buildPath = basePath / "build"
+    buildPath.mkdir(parents=True, exist_ok=True)
 
-            for (output, options) in config.installers.items():
+    outputPath = basePath / "output"
+    outputPath.mkdir(parents=True, exist_ok=True)
 
-                doCopy(options.pre)
+    embedPath = basePath / "embed"
+    embedPath.mkdir(parents=True, exist_ok=True)
 
-                installerSourcePath = installerSourceDirPath / options.source
-                installerPath = installerOutputDirPath / output
+    sourcePath = basePath / config.sourcePath
 
-                certificatePath = None
-                if "certificatePath" in config:
-                    certificatePath = pathlib.Path(config.certificatePath)
+    setVersion(sourcePath, config.exeName)
 
-                codesigningKey = None
-                if "codesigningKey" in config:
-                    codesigningKey = config.codesigningKey
+    if "embedData" in config:
+        for (k, v) in config.embedData.items():
+            target = sourcePath / k
+            sourceData = pathlib.Path(v)
 
-                createInstaller(installerSourcePath,
-                                installerPath,
-                                options.title,
-                                version,
-                                sign=parms.sign,
-                                innoSetupPath=pathlib.Path(config.innoSetupPath),
-                                signTool=config.signTool,
-                                codesigningKey=codesigningKey,
-                                certificatePath =certificatePath,
-                                timestampUrl=config.timestampUrl,
-                                additionalParms=options.get("additionalParms", {}))
+            data = json.loads(sourceData.read_text())
+            data = f"{target.stem} = {json.dumps(data, indent=2)}\n"
 
-                doCopy(options.post)
+            target.write_text(data)
 
-    if parms.withZip:
-        print("Creating zip files")
-        if sys.platform == "linux":
+    pathlib.Path("buildout").mkdir(exist_ok=True, parents=True)
+    pathlib.Path("buildcss").mkdir(exist_ok=True, parents=True)
 
-            for (output, options) in config.zips.items():
+    if "pnpm" in config or "require" in config:
+        os.environ["NODE_OPTIONS"] = "--max-old-space-size=8192"
 
-                doCopy(options.pre)
+    copyEngine = CopyEngine(config.copyMode, jobs=parms.jobs)
 
-                prefixPath = pathlib.Path(config.exeName)
-                zipPath = pathlib.Path("output") / output
-                embedPath = pathlib.Path("embed")
+    cache = None
+    if config.objectCache.enabled and not parms.noCache:
+        cache = ObjectCache(config.objectCache.path, maxSize=config.objectCache.maxSize)
 
-                included = set()
+    # Every stage is a task, dependencies follow from the declared inputs and outputs (see Scheduler)
+    scheduler = Scheduler(parms.jobs)
 
-                print(f"Creating zip file {str(zipPath)}")
+    if parms.buildEmbed:
+        scheduler.add("embed",
+                      functools.partial(createEmbedded, embedPath,
+                                        exeName=config.exeName,
+                                        createDirs=config.createDirs,
+                                        copyTrees=config.copyTrees,
+                                        copyFiles=config.copyFiles,
+                                        deleteFiles=config.deleteFiles,
+                                        compModules=config.compModules,
+                                        buildPath=buildPath,
+                                        includeTkinter=config.withTkinter,
+                                        removeTests=False,
+                                        withLibraryZip=config.withLibraryZip,
+                                        copyEngine=copyEngine),
+                      outputs=[embedPath, buildPath / "requirements.txt", buildPath / "library.zip", buildPath / "embed.json"])
+
+    templateTargets = [embedPath / target for files in config.template.values() for target in files]
+    if templateTargets:
+        scheduler.add("templates", functools.partial(applyTemplates, config, basePath, embedPath), outputs=templateTargets)
+
+    # Executables are grouped by optimization mode, each group compiles its shared modules once
+    targetGroups = {}
 
-                with zipfile.ZipFile(zipPath, "w", compression=zipfile.ZIP_DEFLATED) as zip:
-                    ignoreList = options.get("ignore", [])
+    for exeName, compileArgs in config.compile.items():
 
-                    for filePath in embedPath.glob("**/*"):
-                        relFilePath = filePath.relative_to(embedPath)
-                        if inPatternList(relFilePath, ignoreList):
-                            continue
+        if "onlyOn" in compileArgs:
+            if sys.platform not in compileArgs.onlyOn:
+                continue
 
-                        for ignorePattern in ignoreList:
-                            relFilePath.full_match(ignorePattern)
-                            continue
-                        if filePath.is_file():
-                            targetName = str(prefixPath / relFilePath)
-                            # print(f"Adding {str(filePath)} as {targetName}")
-                            included.add(targetName)
-                            zip.write(filePath, targetName)
+        if parms.annotate:
+            scheduler.add(f"annotate:{exeName}",
+                          functools.partial(annotate, sourcePath, exeName, compileArgs.sources, directives=compileArgs.directives, jobs=parms.jobs),
+                          outputs=[sourcePath / "build" / "annotate" / exeName])
+
+        optimize = parms.optimize or compileArgs.get("optimize")
+        if parms.optimize == "pgo" and not compileArgs.get("training"):
+            print(f"{exeName} has no training command, using lto instead of pgo")
+            optimize = "lto"
+        targetGroups.setdefault(optimize, {})[exeName] = compileArgs
+
+    compileTasks = []
+    for optimize, targets in targetGroups.items():
+
+        exePaths = {}
+
+        def compileGroup(targets=targets, optimize=optimize, exePaths=exePaths):
+            exePaths.update(compileOptimized(sourcePath,
+                                             targets,
+                                             optimize=optimize,
+                                             force=parms.force,
+                                             jobs=parms.jobs,
+                                             cache=cache,
+                                             importTime=parms.importTime,
+                                             appendLibrary=config.withLibraryZip,
+                                             sharedUtility=config.sharedUtility))
+
+        # Linking appends build/library.zip written by the embed task
+        compileTask = scheduler.add(f"compile:{optimize or 'default'}",
+                                    compileGroup,
+                                    inputs=[buildPath / "library.zip"],
+                                    outputs=[sourcePath / "build"])
+        compileTasks.append(scheduler.add(f"install:{optimize or 'default'}",
+                                          functools.partial(installExecutables, exePaths),
+                                          deps=[compileTask],
+                                          outputs=[getBinPath()]))
+
+    messagesTask = scheduler.add("messages",
+                                 functools.partial(procMessages, config.sourcePath, config.exeName),
+                                 outputs=[buildPath / "messages.pot", "locale"])
+    scheduler.add("locale", functools.partial(copyLocale, copyEngine), deps=[messagesTask], outputs=[embedPath / "locale"])
 
-                    if "extra" in options:
-                        extra = json.loads(pathlib.Path(options.extra).read_text())
-                        extra = addict.Dict(extra)
+    if "userguide" in config:
 
-                        for fileName in extra.fileList:
-                            filePath = pathlib.Path(fileName)
-                            targetName = str(prefixPath / filePath)
-                            if targetName not in included:
-                                included.add(targetName)
-                                # print(f"Adding {str(filePath)} as {targetName}")
-                                zip.write(filePath, targetName)
-
-                        for dirName in extra.dirList:
-                            dirPath = pathlib.Path(dirName)
-                            for filePath in dirPath.glob("**/*"):
-                                if filePath.is_file():
-                                    targetName = str(prefixPath / filePath)
-                                    if targetName not in included:
-                                        included.add(targetName)
-                                        # print(f"Adding {str(filePath)} as {targetName}")
-                                        zip.write(filePath, targetName)
+        userguidePath = pathlib.Path(config.userguide)
+        targetPath = pathlib.Path("embed") / config.userguide
 
-                doCopy(options.post)
+        for dir in userguidePath.glob("*"):
+            userguideTask = scheduler.add(f"userguide:{dir.name}", functools.partial(buildUserguide, dir), outputs=[dir / "site"])
+            scheduler.add(f"userguideCopy:{dir.name}",
+                          functools.partial(copyUserguide, dir, targetPath, copyEngine),
+                          deps=[userguideTask],
+                          outputs=[targetPath / dir.name])
+
+    addWebTasks(scheduler, config, buildPath, jobs=parms.jobs, deps=[name for name in ["embed", "templates"] if name in scheduler.tasks])
+
+    # The packaging steps read the whole tree, so they wait for all build tasks and run one after the other
+    scheduler.add("lateCopy",
+                  functools.partial(doCopy, config.lateCopy, copyEngine),
+                  deps=list(scheduler.tasks),
+                  inputs=[basePath],
+                  outputs=[embedPath])
+
+    # After the last copy into embed, the copies of the installers and zips recompile what they overwrite
+    if config.bytecode.enabled:
+        scheduler.add("bytecode",
+                      functools.partial(compileBytecode, embedPath, optimize=config.bytecode.optimize, jobs=parms.jobs),
+                      inputs=[embedPath],
+                      outputs=[embedPath])
+
+    if parms.withInstaller and sys.platform == "win32":
+        scheduler.add("installers", functools.partial(createInstallers, parms, config, version, copyEngine), inputs=[basePath], outputs=[outputPath])
+
+    if parms.withZip and sys.platform == "linux":
+        scheduler.add("zips", functools.partial(createZips, config, copyEngine, jobs=parms.jobs), inputs=[basePath], outputs=[outputPath])
 
     if parms.withUnzip:
-        for (output, source) in config.unzip:
-            outputPath = pathlib.Path(output)
-            shutil.rmtree(outputPath, ignore_errors=True)
-            outputPath.mkdir(parents=True, exist_ok=True)
-            with zipfile.ZipFile(source) as zipFile:
-                for member in zipFile.infolist():
-                    extracted_path = zipFile.extract(member, outputPath)
-
-                    # Restore file permissions (including execute) if created on Unix
-                    if member.create_system == 3:
-                        unix_mode = member.external_attr >> 16
-                        if unix_mode:
-                            os.chmod(extracted_path, unix_mode)
+        scheduler.add("unzip", functools.partial(unzipAll, config, jobs=parms.jobs), inputs=[basePath], outputs=[output for (output, source) in config.unzip])
 
     if parms.upload:
+        scheduler.add("upload", functools.partial(uploadAll, parms, config, version, basePath), inputs=[basePath])
 
-        if parms.publish:
-
-            for installer, options in config.installers.items():
-
-                installerPath = pathlib.Path("output") / installer
-                versionPath = pathlib.Path("output") / options.currentVersion
-
-                publishInstaller(installerPath,
-                                 version,
-                                 downloadUrl=options.downloadUrl,
-                                 installArgs=config.installArgs,
-                                 updateInterval=config.updateInterval,
-                                 keytoolConfigPath=basePath / "keytool.json",
-                                 versionPath=versionPath)
+    scheduler.run()
 
-        if config.uploadHost and config.uploadHost != "$(UPLOAD_HOST}" and config.uploadHost != " " :
-            upload(config.upload, version, config.uploadPrefix)
+    if cache and compileTasks:
+        print(cache.summary())
+    print(copyEngine.summary())
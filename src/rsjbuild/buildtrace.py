@@ -0,0 +1,91 @@
+import os
+import time
+import json
+import pathlib
+import threading
+import contextlib
+import logging
+
+logger = logging.getLogger(__file__)
+
+
+class Tracer:
+    """
+    Collects spans (build stages, subprocesses, cython, compile and link steps) in Chrome trace-event format.
+
+    The trace file opens in Perfetto (ui.perfetto.dev) or chrome://tracing. Timestamps are wall clock
+    microseconds, so spans measured in worker processes line up with the main process.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def add(self, name, category, start, duration, args={}, pid=None, tid=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": int(start * 1e6),
+            "dur": int(duration * 1e6),
+            "pid": pid or os.getpid(),
+            "tid": tid or threading.get_native_id(),
+            "args": dict(args),
+            }
+
+        with self.lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name, category="stage", **args):
+        start = time.time()
+        try:
+            yield args
+        except BaseException as e:
+            args.setdefault("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self.add(name, category, start, time.time() - start, args)
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+
+    def write(self, tracePath):
+        tracePath = pathlib.Path(tracePath)
+        tracePath.parent.mkdir(parents=True, exist_ok=True)
+
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+
+        tracePath.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+
+    def summary(self, top=10):
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["dur"], reverse=True)
+
+        lines = [f"Top {top} slowest steps:"]
+        for event in events[:top]:
+            status = ""
+            if "error" in event["args"]:
+                status = "  (failed)"
+            elif event["args"].get("exitCode"):
+                status = f"  (exit code {event['args']['exitCode']})"
+            lines.append(f"{event['dur'] / 1e6:9.2f}s  {event['cat']:10s}  {event['name']}{status}")
+        return "\n".join(lines)
+
+
+tracer = Tracer()
+
+
+def span(name, category="stage", **args):
+    return tracer.span(name, category, **args)
+
+
+def shortCommand(cmd, maxLength=80):
+    # Span name of a command line, the program is shown without path and suffix ("pybabel extract ...")
+    parts = cmd.split(" ", 1)
+    name = " ".join([pathlib.Path(parts[0]).stem] + parts[1:])
+    if len(name) > maxLength:
+        name = name[:maxLength - 3] + "..."
+    return name
@@ -1,18 +1,32 @@
+import re
 import sys
 import pathlib
 import sysconfig
 import stat
 import collections
+import json
 import logging
+import threading
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__file__)
 
 from setuptools._distutils.ccompiler import new_compiler
+from setuptools._distutils.errors import DistutilsExecError
 
-from .utils import pythonCall, template
+from .utils import template
+from .transpile import cythonize, getJobs, getDirectives, workerSlot
+from .manifest import getBuildKey, getModuleKey, getLinkKey, loadManifest, saveManifest
+from .dependencies import DependencyScanner
+from .buildtrace import span
 
 rsjbuildPath = pathlib.Path(__file__).parent.resolve()
 
+# Module holding the Cython utility code shared by all modules in sharedUtility mode
+sharedUtilityName = "_cyutility"
+
 
 def getCompiler(noInit=False):
 
@@ -42,7 +56,106 @@ def getCompiler(noInit=False):
 
     return compiler
 
-def compile(sourcePath, exeName, mainModule, sources, force=True, noConsole=False, library=False, noInit=False):
+@contextlib.contextmanager
+def compilerSpan(compiler, name, category, **args):
+    """
+    Trace span of a compiler call, recording the commands run by the compiler and their exit code like system().
+    """
+    # Newer distutils run commands with Compiler.call, older ones with Compiler.spawn
+    method = "call" if hasattr(compiler, "call") else "spawn"
+
+    with span(name, category, **args) as spanArgs:
+        run = getattr(compiler, method)
+
+        def tracedRun(cmd, **kwargs):
+            spanArgs["command"] = " ".join(str(arg) for arg in cmd)
+            try:
+                result = run(cmd, **kwargs)
+            except subprocess.CalledProcessError as e:
+                spanArgs["exitCode"] = e.returncode
+                raise
+            except DistutilsExecError as e:
+                # "command 'gcc' failed with exit code 1"
+                match = re.search(r"exit code (-?\d+)", str(e))
+                spanArgs["exitCode"] = int(match.group(1)) if match else None
+                raise
+            spanArgs["exitCode"] = 0
+            return result
+
+        setattr(compiler, method, tracedRun)
+        try:
+            yield spanArgs
+        finally:
+            setattr(compiler, method, run)
+
+def compileSources(cSources, jobs=None, noInit=False, extraPostArgs=[]):
+    # Every worker thread gets its own compiler instance, gcc/cl run as subprocesses and release the GIL
+    local = threading.local()
+
+    def compileSource(cSource):
+        if not hasattr(local, "compiler"):
+            local.compiler = getCompiler(noInit=noInit)
+        with workerSlot(), compilerSpan(local.compiler, f"cc {cSource}", "compile", source=cSource):
+            return local.compiler.compile([cSource], extra_postargs=extraPostArgs)
+
+    if not cSources:
+        return []
+
+    jobs = min(getJobs(jobs), len(cSources))
+    print(f"Compiling {len(cSources)} C sources with {jobs} jobs")
+
+    compiledObjects = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for objects in executor.map(compileSource, cSources):
+            compiledObjects += objects
+
+    return compiledObjects
+
+def getLinkerArgs(noConsole=False):
+    linkerArgs = []
+
+    if sys.platform == "win32":
+        if noConsole:
+            linkerArgs = ["/subsystem:windows", "/entry:wmainCRTStartup"]
+
+    if sys.platform == "linux":
+        configVars = sysconfig.get_config_vars()
+
+        linkForShared = configVars.get("LINKFORSHARED")
+        linkForShared = linkForShared.split(" ")
+        linkerArgs = linkForShared + ["--no-pie", "-Xlinker", "--copy-dt-needed-entries"]
+
+    return linkerArgs
+
+def compile(sourcePath, exeName, mainModule, sources, noConsole=False, directives={}, **kwargs):
+
+    targets = {
+        exeName: {
+            "mainModule": mainModule,
+            "sources": sources,
+            "noConsole": noConsole,
+            "directives": directives,
+            }
+        }
+
+    exePaths = compileTargets(sourcePath, targets, **kwargs)
+
+    return exePaths[exeName]
+
+def compileTargets(sourcePath, targets, force=True, library=False, noInit=False, jobs=None, cache=None, extraCompileArgs=[], extraLinkArgs=[], keyExtra=None, importTime=False, appendLibrary=False, sharedUtility=False):
+    """
+    Compiles several executables. targets maps the executable name to a dict with mainModule, sources and
+    optionally noConsole and directives.
+
+    The union of all modules is compiled once. The bootstrap modules are generated per executable in
+    build/<exeName>, and all executables are linked concurrently. Returns a dict of executable paths.
+
+    With sharedUtility, the Cython utility code which modules can share (memoryviews) is compiled once into
+    the module _cyutility instead of into every module using it.
+    """
+
+    if not targets:
+        return {}
 
     targetPath = pathlib.Path("build")
 
@@ -50,109 +163,184 @@ def compile(sourcePath, exeName, mainModule, sources, force=True, noConsole=Fals
     buildPath.mkdir(parents=True, exist_ok=True)
 
     cSources = []
-    objects = []
-    pySources = []
-
-    modules = []
-
-    packageModules = collections.defaultdict(list)
-    qualifiedModules = []
+    transpileModules = []
 
     if sys.platform == "win32":
         objSuffix = ".obj"
         exeSuffix = ".exe"
-
-        rcPath = (buildPath / exeName).with_suffix(".rc")
-        if rcPath.exists():
-            cSources.append(rcPath)
     else:
         objSuffix = ".o"
         exeSuffix = ""
 
-    sourceSet = set()
-    for source in sources:
-        sourceSet.update(list(sourcePath.glob(source)))
-    sources = sorted(list(sourceSet))
+    compileArgs = []
+    if library:
+        if sys.platform == "linux":
+            compileArgs = ["-fPIC"]
+    compileArgs = compileArgs + list(extraCompileArgs)
+
+    buildKey = getBuildKey(getCompiler(noInit=True), compileArgs, keyExtra=keyExtra)
+
+    manifest = loadManifest(buildPath)
+    moduleKeys = manifest.setdefault("modules", {})
+    bootstrapKeys = manifest.setdefault("bootstrap", {})
+    builtKeys = {}
+    builtBootstrapKeys = {}
+
+    scanner = DependencyScanner(sourcePath)
+    dependencyGraph = {}
+
+    cacheEntries = []
+
+    sharedName = sharedUtilityName if sharedUtility else None
+    sharedSource = None
+    sharedObjects = []
+
+    if sharedName:
+        objPath = (buildPath / sharedName).with_suffix(objSuffix)
+        sharedKey = getModuleKey(sharedName, buildKey)
+
+        if force or not objPath.exists() or moduleKeys.get(sharedName) != sharedKey:
+            builtKeys[sharedName] = sharedKey
+            sharedSource = (buildPath / sharedName).with_suffix(".c")
+            cSources.append(sharedSource)
+
+        sharedObjects.append(objPath)
+
+    # Modules of all targets, directives of all targets including a module are merged
+    targetModules = {}
+    moduleDirectives = {}
+
+    for exeName, target in targets.items():
+        sourceSet = set()
+        for source in target["sources"]:
+            sourceSet.update(list(sourcePath.glob(source)))
+
+        targetModules[exeName] = [filePath for filePath in sorted(sourceSet) if filePath.stem != "__init__"]
 
+        for filePath in targetModules[exeName]:
+            moduleDirectives.setdefault(filePath, {}).update(getDirectives(filePath, sourcePath, target.get("directives") or {}))
 
-    for filePath in sources:
+    moduleObjects = {}
+
+    for filePath in sorted(moduleDirectives):
         modName = filePath.stem
-        if modName != "__init__":
-            if filePath.parent == sourcePath:
-                package = ""
-            else:
-                package = filePath.parent.stem
-            objPath = (buildPath / modName).with_suffix(objSuffix)
+        if filePath.parent == sourcePath:
+            qualifiedName = modName
         else:
-            continue
+            qualifiedName = f"{filePath.parent.stem}.{modName}"
+        objPath = (buildPath / modName).with_suffix(objSuffix)
+
+        moduleObjects[filePath] = objPath
+
+        dependencies = scanner.dependencies(filePath)
+        moduleKey = getModuleKey(scanner.hash(filePath), buildKey,
+                                 [scanner.hash(dependency) for dependency in dependencies] + [json.dumps(moduleDirectives[filePath], sort_keys=True)] +
+                                 ([sharedName] if sharedName else []))
+        dependencyGraph[modName] = [dependency.as_posix() for dependency in dependencies]
 
         dirty = True
         if not force:
             if objPath.exists():
-                if objPath.stat().st_mtime > filePath.stat().st_mtime:
+                if moduleKeys.get(modName) == moduleKey:
                     dirty = False
 
-        packageModules[package].append(modName)
-        modules.append(modName)
+        if dirty:
+            builtKeys[modName] = moduleKey
+            cPath = (buildPath / modName).with_suffix(".c")
 
-        if package:
-            qualifiedModules.append(f"{package}.{modName}")
-        else:
-            qualifiedModules.append(modName)
+            if cache:
+                cacheKey = cache.getKey(moduleKey, qualifiedName, objSuffix)
+                if not force and cache.fetch(cacheKey, [cPath, objPath]):
+                    continue
+                cacheEntries.append((cacheKey, [cPath, objPath]))
 
-        if dirty:
-            pySources.append(filePath)
-            cSources.append((buildPath / modName).with_suffix(".c"))
-        else:
-            objects.append(objPath)
+            transpileModules.append((filePath, cPath, False, moduleDirectives[filePath], False, sharedName))
+            cSources.append(cPath)
 
-    packages = list(filter(lambda x: len(x) > 0, packageModules.keys()))
+    targetObjects = {}
 
-    template(rsjbuildPath / "bootstrap.pyx",
-             buildPath / "bootstrap.pyx",
-             modules=packageModules[""] + packages,
-             package="__main__",
-             packages=packages,
-             qualifiedModules=qualifiedModules,
-             mainModule=mainModule,
-             debug=False)
+    for exeName, target in targets.items():
+        targetBuildPath = buildPath / exeName
+        targetBuildPath.mkdir(parents=True, exist_ok=True)
 
-    template(rsjbuildPath / "bootstrap.h",
-             buildPath / "__main__.h",
-             modules=packageModules[""],
-             packages=packages)
+        objects = [moduleObjects[filePath] for filePath in targetModules[exeName]] + sharedObjects
 
-    pythonCall(f'-m cython -3 --embed --no-docstrings {str(buildPath / "bootstrap.pyx")}')
-    cSources.append(buildPath / "bootstrap.c")
+        if sys.platform == "win32":
+            rcPath = (buildPath / exeName).with_suffix(".rc")
+            if rcPath.exists():
+                cSources.append(rcPath)
+                objects.append(rcPath)
+
+        packageModules = collections.defaultdict(list)
+        qualifiedModules = []
+
+        for filePath in targetModules[exeName]:
+            modName = filePath.stem
+            if filePath.parent == sourcePath:
+                package = ""
+                qualifiedModules.append(modName)
+            else:
+                package = filePath.parent.stem
+                qualifiedModules.append(f"{package}.{modName}")
+            packageModules[package].append(modName)
+
+        packages = list(filter(lambda x: len(x) > 0, packageModules.keys()))
+
+        # The shared utility module is imported by name from the modules using it
+        if sharedName:
+            packageModules[""].append(sharedName)
 
-    for package in packages:
         template(rsjbuildPath / "bootstrap.pyx",
-                 buildPath / f"{package}.pyx",
-                 modules=packageModules[package],
-                 package=package,
+                 targetBuildPath / "bootstrap.pyx",
+                 modules=packageModules[""] + packages,
+                 package="__main__",
+                 packages=packages,
                  qualifiedModules=qualifiedModules,
-                 packages=[],
+                 mainModule=target["mainModule"],
+                 importTime=importTime,
+                 libraryZip=appendLibrary and sys.platform != "win32",
                  debug=False)
-        template(rsjbuildPath / "bootstrap.h",
-                 buildPath / f"{package}.h",
-                 modules=packageModules[package],
-                 package=package,
-                 packages=[])
 
-        pySources.append((buildPath / package).with_suffix(".pyx"))
-
-        cSources.append((buildPath / package).with_suffix(".c"))
-
-    if len(pySources):
-        pySources = list(map(str, pySources))
+        template(rsjbuildPath / "bootstrap.h",
+                 targetBuildPath / "__main__.h",
+                 modules=packageModules[""],
+                 packages=packages)
+
+        bootstrapModules = [("bootstrap", "__main__.h", True)]
+
+        for package in packages:
+            template(rsjbuildPath / "bootstrap.pyx",
+                     targetBuildPath / f"{package}.pyx",
+                     modules=packageModules[package],
+                     package=package,
+                     qualifiedModules=qualifiedModules,
+                     packages=[],
+                     debug=False)
+            template(rsjbuildPath / "bootstrap.h",
+                     targetBuildPath / f"{package}.h",
+                     modules=packageModules[package],
+                     package=package,
+                     packages=[])
+
+            bootstrapModules.append((package, f"{package}.h", False))
+
+        # Bootstrap modules are only regenerated if their rendered templates changed
+        for (name, headerName, embed) in bootstrapModules:
+            pyxPath = targetBuildPath / f"{name}.pyx"
+            objPath = (targetBuildPath / name).with_suffix(objSuffix)
+            bootstrapName = f"{exeName}/{name}"
+            bootstrapKey = getModuleKey(scanner.hash(pyxPath), buildKey, [scanner.hash(targetBuildPath / headerName)])
+
+            if force or not objPath.exists() or bootstrapKeys.get(bootstrapName) != bootstrapKey:
+                builtBootstrapKeys[bootstrapName] = bootstrapKey
+                transpileModules.append((pyxPath, pyxPath.with_suffix(".c"), embed))
+                cSources.append(pyxPath.with_suffix(".c"))
 
-        rest = pySources
+            objects.append(objPath)
 
-        while len(rest):
+        targetObjects[exeName] = objects
 
-            pythonCall(f"-m cython -3 --no-docstrings --output-file {str(buildPath)} {' '.join(rest[:20])}")
-        
-            rest = rest[20:]
+    cythonize(transpileModules, jobs=jobs, sharedUtility=sharedSource)
 
     cSourcesRel = []
 
@@ -161,66 +349,79 @@ def compile(sourcePath, exeName, mainModule, sources, force=True, noConsole=Fals
             cSourcesRel.append(str(cSource))
         except Exception:
             print("Problem resolving", cSource)
-    compileArgs = []
-    if library:
-        if sys.platform == "linux":
-            compileArgs = ["-fPIC"]
-
     print("cSources", cSourcesRel)
 
-    compiledObjects  = getCompiler(noInit=True).compile(cSourcesRel,  extra_postargs=compileArgs)
+    compiledObjects = compileSources(cSourcesRel, jobs=jobs, noInit=True, extraPostArgs=compileArgs)
 
-    for compileObject in compiledObjects:
-        if sys.platform == "linux":
-            objects.append(pathlib.Path( compileObject))
-        else:
-            objects.append(pathlib.Path(compileObject))
+    # Objects whose name is chosen by the compiler (e.g. resources)
+    objectMap = dict(zip(cSourcesRel, compiledObjects))
 
-    if sys.platform =="win32":
-        objects += ["kernel32.lib", "ucrt.lib", "vcruntime.lib"]
+    moduleKeys.update(builtKeys)
+    bootstrapKeys.update(builtBootstrapKeys)
+    manifest["dependencies"] = dependencyGraph
+    saveManifest(buildPath, manifest)
 
-    objects = list(map(str, objects))
-    print("Objects", objects)
+    if cache:
+        for (cacheKey, cachePaths) in cacheEntries:
+            cache.store(cacheKey, cachePaths)
+        cache.evict()
 
-    linkerArgs = []
+    linkKeys = manifest.setdefault("link", {})
 
-    outputName = exeName
+    def linkTarget(exeName):
+        objects = [objectMap.get(str(objPath), str(objPath)) for objPath in targetObjects[exeName]]
 
-    if sys.platform == "win32":
-        outputName = "tmp"
+        if sys.platform =="win32":
+            objects += ["kernel32.lib", "ucrt.lib", "vcruntime.lib"]
 
-        if noConsole:
-            linkerArgs = ["/subsystem:windows", "/entry:wmainCRTStartup"]
+        print(exeName, "Objects", objects)
 
-    if sys.platform == "linux":
-        configVars = sysconfig.get_config_vars()
+        # The bytecode archive (build/library.zip) is appended to the linked executable
+        withLibrary = sys.platform == "win32" or appendLibrary
 
-        linkForShared = configVars.get("LINKFORSHARED")
-        linkForShared = linkForShared.split(" ")
-        linkerArgs = linkForShared + ["--no-pie", "-Xlinker", "--copy-dt-needed-entries"]
+        outputName = exeName
+
+        if withLibrary:
+            outputName = f"{exeName}_tmp"
 
-        pythonVersion = sys.version_info
-        pythonMainVersion = f"{pythonVersion.major}.{pythonVersion.minor}"
-        # /usr/lib/python3.11/config-3.11-x86_64-linux-gnu/libpython3.11-pic.a
-        objects = [f"/usr/lib/python{pythonMainVersion}/config-{pythonMainVersion}-x86_64-linux-gnu/libpython{pythonMainVersion}-pic.a"] + objects
+        if sys.platform == "linux":
+            pythonVersion = sys.version_info
+            pythonMainVersion = f"{pythonVersion.major}.{pythonVersion.minor}"
+            # /usr/lib/python3.11/config-3.11-x86_64-linux-gnu/libpython3.11-pic.a
+            objects = [f"/usr/lib/python{pythonMainVersion}/config-{pythonMainVersion}-x86_64-linux-gnu/libpython{pythonMainVersion}-pic.a"] + objects
 
-    getCompiler().link_executable(objects, outputName, output_dir="build", extra_preargs=linkerArgs)
+        linkerArgs = getLinkerArgs(noConsole=targets[exeName].get("noConsole")) + list(extraLinkArgs)
 
-    exePath = (targetPath / exeName).with_suffix(exeSuffix)
+        linkKey = getLinkKey(objects, linkerArgs)
+        linkPath = (targetPath / outputName).with_suffix(exeSuffix)
 
-    if sys.platform == "win32":
-        with exePath.open("wb") as f:
-            tmpPath = (targetPath / "tmp").with_suffix(exeSuffix)
-            exeBytes = tmpPath.read_bytes()
-            f.write(exeBytes)
+        if not force and linkPath.exists() and linkKeys.get(exeName) == linkKey:
+            print(f"{str(linkPath)} is up to date, skipping link")
+        else:
+            compiler = getCompiler()
+            with workerSlot(), compilerSpan(compiler, f"link {exeName}", "link", objects=len(objects)):
+                compiler.link_executable(objects, outputName, output_dir="build", extra_preargs=linkerArgs)
+            linkKeys[exeName] = linkKey
+
+        exePath = (targetPath / exeName).with_suffix(exeSuffix)
+
+        if withLibrary:
+            with exePath.open("wb") as f:
+                exeBytes = linkPath.read_bytes()
+                f.write(exeBytes)
+
+                zipLib = targetPath / "library.zip"
+                zipBytes = zipLib.read_bytes()
+                f.write(zipBytes)
 
-            zipLib = targetPath / "library.zip"
-            zipBytes = zipLib.read_bytes()
-            f.write(zipBytes)
+            if sys.platform != "win32":
+                exePath.chmod(exePath.stat().st_mode | stat.S_IEXEC | stat.S_IXGRP | stat.S_IXOTH | stat.S_IXUSR)
 
-        if sys.platform != "win32":
-            exePath.chmod(exePath.stat().st_mode | stat.S_IEXEC | stat.S_IXGRP | stat.S_IXOTH | stat.S_IXUSR)
+        return exePath
 
-    return exePath
+    with ThreadPoolExecutor(max_workers=min(getJobs(jobs), len(targets))) as executor:
+        exePaths = dict(zip(targets, executor.map(linkTarget, targets)))
 
+    saveManifest(buildPath, manifest)
 
+    return exePaths
@@ -0,0 +1,181 @@
+import os
+import gzip
+import json
+import hashlib
+import pathlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__file__)
+
+from .transpile import getJobs, getProcessContext, submitWorker
+from .scanner import scanTree
+
+# Suffix of the precompressed variant for each encoding, as expected by web servers (gzip_static, brotli_static, ...)
+suffixes = {
+    "gzip": ".gz",
+    "brotli": ".br",
+    "zstd": ".zst",
+    }
+
+# Leading bytes of formats which are compressed already, another compression pass only wastes time
+magicNumbers = [
+    b"\x1f\x8b",                # gzip
+    b"PK\x03\x04",              # zip, jar, docx, xlsx, ...
+    b"\x89PNG",                 # png
+    b"\xff\xd8\xff",            # jpeg
+    b"GIF8",                    # gif
+    b"\x28\xb5\x2f\xfd",        # zstd
+    b"\xfd7zXZ\x00",            # xz
+    b"BZh",                     # bzip2
+    b"7z\xbc\xaf\x27\x1c",      # 7z
+    b"wOFF",                    # woff
+    b"wOF2",                    # woff2
+    b"OggS",                    # ogg
+    b"ID3",                     # mp3
+    b"\x1a\x45\xdf\xa3",        # webm, mkv
+    ]
+
+manifestName = "precompress.json"
+
+
+def isCompressed(data):
+    if any(data.startswith(magic) for magic in magicNumbers):
+        return True
+    # RIFF containers (webp, avi, wav) and ISO media (mp4, heic, avif)
+    return (data[:4] == b"RIFF" and data[8:12] in [b"WEBP", b"AVI "]) or data[4:8] == b"ftyp"
+
+
+def compressData(data, encoding, level):
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+
+    if encoding == "brotli":
+        try:
+            import brotli
+        except ImportError:
+            raise ValueError("brotli precompression needs the brotli package (pip install rsjbuild[compress])")
+        return brotli.compress(data, quality=level)
+
+    if encoding == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd precompression needs the zstandard package (pip install rsjbuild[compress])")
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    raise ValueError(f"Unknown precompression encoding {encoding}")
+
+
+def compressFile(filePath, formats, entries):
+    # Returns (filePath, entries, state) with state "compressed", "current" or "skipped"
+    sourceStat = filePath.stat()
+    sourceHash = None
+
+    pending = {}
+    for encoding, level in formats.items():
+        outputPath = filePath.with_name(filePath.name + suffixes[encoding])
+        entry = entries.get(encoding)
+
+        # Entries marked larger have no output, the compressed data was not smaller than the source
+        if entry and entry["level"] == level and (outputPath.exists() or entry.get("larger")):
+            if outputPath.exists() and outputPath.stat().st_mtime >= sourceStat.st_mtime:
+                continue
+
+            # The source was touched but may be unchanged (e.g. rebuilt by pnpm)
+            if sourceHash is None:
+                with filePath.open("rb") as f:
+                    sourceHash = hashlib.file_digest(f, "sha256").hexdigest()
+            if entry["hash"] == sourceHash:
+                if outputPath.exists():
+                    os.utime(outputPath)
+                continue
+
+        pending[encoding] = (level, outputPath)
+
+    if not pending:
+        return filePath, entries, "current"
+
+    with filePath.open("rb") as f:
+        if isCompressed(f.read(16)):
+            return filePath, {}, "skipped"
+
+    data = filePath.read_bytes()
+
+    sourceHash = hashlib.sha256(data).hexdigest()
+
+    entries = dict(entries)
+    for encoding, (level, outputPath) in pending.items():
+        compressed = compressData(data, encoding, level)
+
+        # Web servers fall back to the source, a variant which does not shrink it only wastes space
+        if len(compressed) >= len(data):
+            outputPath.unlink(missing_ok=True)
+            entries[encoding] = {"level": level, "hash": sourceHash, "larger": True}
+            continue
+
+        tmpPath = outputPath.with_name(outputPath.name + ".tmp")
+        tmpPath.write_bytes(compressed)
+        tmpPath.replace(outputPath)
+        entries[encoding] = {"level": level, "hash": sourceHash}
+
+    return filePath, entries, "compressed"
+
+
+def precompress(dirs, formats, buildPath=pathlib.Path("build"), jobs=None):
+    """
+    Writes precompressed variants (file.gz, file.br, file.zst) next to all files in dirs, using all cores.
+
+    formats maps the encodings gzip, brotli and zstd to their compression level, gzip uses level 9 unless it is
+    configured, false disables an encoding. Outputs newer than their source
+    or created from a source with the same hash and level are kept. Already compressed content (images, archives,
+    fonts, ...) is detected by its leading bytes and skipped, variants which are not smaller than their source
+    are not written.
+    """
+    formats = {encoding: level for encoding, level in {"gzip": 9, **formats}.items() if level is not False}
+    if not formats:
+        return
+
+    for encoding in formats:
+        if encoding not in suffixes:
+            raise ValueError(f"Unknown precompression encoding {encoding}")
+
+    manifestPath = buildPath / manifestName
+    try:
+        manifest = json.loads(manifestPath.read_text())
+    except Exception:
+        manifest = {}
+
+    outputPatterns = [f"*{suffix}" for suffix in suffixes.values()] + ["*.tmp"]
+
+    filePaths = []
+    for dir in dirs:
+        filePaths += scanTree(dir, ignore=outputPatterns)
+
+    if not filePaths:
+        return
+
+    jobs = min(getJobs(jobs), len(filePaths))
+    print(f"Precompressing {len(filePaths)} files ({', '.join(formats)}) with {jobs} jobs")
+
+    counts = {"compressed": 0, "current": 0, "skipped": 0}
+
+    # Only files still present are kept in the manifest
+    newManifest = {}
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=getProcessContext()) as executor:
+        futures = [submitWorker(executor, compressFile, filePath, formats, manifest.get(filePath.as_posix(), {}))
+                   for filePath in filePaths]
+
+        for future in futures:
+            filePath, entries, state = future.result()
+            counts[state] += 1
+            if entries:
+                newManifest[filePath.as_posix()] = entries
+
+    buildPath.mkdir(parents=True, exist_ok=True)
+    tmpPath = manifestPath.with_suffix(".tmp")
+    tmpPath.write_text(json.dumps(newManifest, indent=2, sort_keys=True))
+    tmpPath.replace(manifestPath)
+
+    print(f"Precompressed {counts['compressed']} files, {counts['current']} up to date, {counts['skipped']} already compressed")
@@ -0,0 +1,182 @@
+import os
+import sys
+import shutil
+import pathlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__file__)
+
+from .transpile import getJobs
+from .manifest import hashFile
+from .scanner import Matcher
+
+# Linux ioctl sharing the extents of a file (copy on write clone on btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+copyModes = ["copy", "hardlink", "reflink"]
+
+
+class CopyEngine:
+    """
+    Copies files and trees incrementally in a thread pool. Targets with the same size and mtime as their source
+    (or the same content) are skipped. Instead of copying, mode "hardlink" links targets to their source and
+    mode "reflink" clones them (copy on write), falling back to copying where the filesystem does not support it.
+
+    Targets are written to a temporary file and renamed, so a hardlinked source is never written through.
+    """
+
+    def __init__(self, mode="copy", jobs=None):
+        if mode not in copyModes:
+            raise ValueError(f"Unknown copy mode {mode}")
+
+        self.mode = mode
+        self.jobs = getJobs(jobs)
+        self.lock = threading.Lock()
+
+        self.files = {"copied": 0, "linked": 0, "skipped": 0, "deleted": 0}
+        self.bytes = {"copied": 0, "linked": 0, "skipped": 0}
+
+    def count(self, state, size):
+        with self.lock:
+            self.files[state] += 1
+            self.bytes[state] += size
+
+    def isCurrent(self, sourcePath, targetPath, sourceStat):
+        try:
+            targetStat = os.stat(targetPath)
+        except OSError:
+            return False
+
+        if (targetStat.st_dev, targetStat.st_ino) == (sourceStat.st_dev, sourceStat.st_ino):
+            return True
+
+        if targetStat.st_size != sourceStat.st_size:
+            return False
+
+        if targetStat.st_mtime_ns == sourceStat.st_mtime_ns:
+            return True
+
+        if hashFile(pathlib.Path(sourcePath)) != hashFile(pathlib.Path(targetPath)):
+            return False
+
+        # Same content, the next comparison succeeds on the mtime
+        os.utime(targetPath, ns=(sourceStat.st_atime_ns, sourceStat.st_mtime_ns))
+        return True
+
+    def link(self, sourcePath, tmpPath):
+        if self.mode == "hardlink":
+            os.link(sourcePath, tmpPath)
+            return True
+
+        if self.mode == "reflink" and sys.platform == "linux":
+            import fcntl
+
+            with open(sourcePath, "rb") as source, open(tmpPath, "wb") as target:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            shutil.copystat(sourcePath, tmpPath)
+            return True
+
+        return False
+
+    def copyFile(self, sourcePath, targetPath):
+        sourcePath = pathlib.Path(sourcePath)
+        targetPath = pathlib.Path(targetPath)
+
+        sourceStat = os.stat(sourcePath)
+        if self.isCurrent(sourcePath, targetPath, sourceStat):
+            self.count("skipped", sourceStat.st_size)
+            return
+
+        targetPath.parent.mkdir(parents=True, exist_ok=True)
+        tmpPath = targetPath.with_name(targetPath.name + ".copy")
+
+        try:
+            linked = self.link(sourcePath, tmpPath)
+        except OSError:
+            # Other filesystem or no clone support
+            tmpPath.unlink(missing_ok=True)
+            linked = False
+
+        if not linked:
+            shutil.copy2(sourcePath, tmpPath)
+
+        os.replace(tmpPath, targetPath)
+        self.count("linked" if linked else "copied", sourceStat.st_size)
+
+    def copyFiles(self, pairs, logErrors=False):
+        """
+        Copies (sourcePath, targetPath) pairs and returns the target paths. With logErrors, failing files are
+        logged instead of raising.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return []
+
+        def copyPair(pair):
+            try:
+                self.copyFile(*pair)
+            except Exception:
+                if not logErrors:
+                    raise
+                logger.exception(str(pair[0]))
+
+        with ThreadPoolExecutor(max_workers=min(self.jobs, len(pairs))) as executor:
+            for result in executor.map(copyPair, pairs):
+                pass
+
+        return [pathlib.Path(targetPath) for (sourcePath, targetPath) in pairs]
+
+    def copyTree(self, sourcePath, targetPath, ignore=None, delete=False):
+        """
+        Copies the tree sourcePath into targetPath (existing files are kept), like shutil.copytree with
+        dirs_exist_ok, and returns the target paths. Files and directories matching an ignore pattern are left
+        out. With delete, files and directories in targetPath which were not copied are deleted.
+        """
+        sourcePath = pathlib.Path(sourcePath)
+        targetPath = pathlib.Path(targetPath)
+        ignoreMatcher = Matcher(ignore)
+
+        if not sourcePath.is_dir():
+            raise FileNotFoundError(f"Source tree {str(sourcePath)} does not exist")
+
+        pairs = []
+        for dirPath, dirNames, fileNames in os.walk(sourcePath, followlinks=True):
+            relDir = pathlib.Path(dirPath).relative_to(sourcePath)
+            relPrefix = "" if relDir == pathlib.Path(".") else relDir.as_posix() + "/"
+
+            dirNames[:] = [dirName for dirName in dirNames if not ignoreMatcher.match(relPrefix + dirName)]
+
+            (targetPath / relDir).mkdir(parents=True, exist_ok=True)
+
+            for fileName in fileNames:
+                if not ignoreMatcher.match(relPrefix + fileName):
+                    pairs.append((pathlib.Path(dirPath) / fileName, targetPath / relDir / fileName))
+
+        targets = self.copyFiles(pairs)
+
+        if delete:
+            self.deleteStale(targetPath, targets)
+
+        return targets
+
+    def deleteStale(self, targetPath, targets):
+        # Deletes files below targetPath which are not in targets, and the directories left empty
+        keep = {os.path.abspath(target) for target in targets}
+        for dirPath, dirNames, fileNames in os.walk(targetPath, topdown=False):
+            for fileName in fileNames:
+                filePath = os.path.join(dirPath, fileName)
+                if os.path.abspath(filePath) not in keep:
+                    os.unlink(filePath)
+                    with self.lock:
+                        self.files["deleted"] += 1
+            if dirPath != str(targetPath) and not os.listdir(dirPath):
+                os.rmdir(dirPath)
+
+    def summary(self):
+        megabytes = {state: size / (1024 * 1024) for state, size in self.bytes.items()}
+        return (f"Copied {self.files['copied']} files ({megabytes['copied']:.1f} MB), "
+                f"linked {self.files['linked']} files ({megabytes['linked']:.1f} MB), "
+                f"skipped {self.files['skipped']} unchanged files ({megabytes['skipped']:.1f} MB), "
+                f"deleted {self.files['deleted']} stale files")
@@ -0,0 +1,150 @@
+import re
+import logging
+
+logger = logging.getLogger(__file__)
+
+from .manifest import hashFile
+
+cimportPattern = re.compile(r"^[ \t]*cimport[ \t]+([^\n#]+)", re.MULTILINE)
+fromCimportPattern = re.compile(r"^[ \t]*from[ \t]+(\.*[\w.]*)[ \t]+cimport[ \t]+(\([^)]*\)|[^\n#]+)", re.MULTILINE)
+# Pure Python mode (.py sources) writes cimports as imports from the cython.cimports package
+pyCimportPattern = re.compile(r"^[ \t]*import[ \t]+([^\n#]*\bcython\.cimports\.[^\n#]+)", re.MULTILINE)
+pyFromCimportPattern = re.compile(r"^[ \t]*from[ \t]+cython\.cimports(?:\.([\w.]+))?[ \t]+import[ \t]+(\([^)]*\)|[^\n#]+)", re.MULTILINE)
+includePattern = re.compile(r"^[ \t]*include[ \t]+['\"]([^'\"]+)['\"]", re.MULTILINE)
+
+
+def splitNames(names):
+    names = names.strip().strip("()")
+    result = []
+    for name in names.split(","):
+        name = name.split()
+        if name:
+            result.append(name[0])
+    return result
+
+
+class DependencyScanner:
+    """
+    Scans Cython sources for cimport and include statements (and cython.cimports imports in pure Python mode)
+    and resolves them to files below sourcePath.
+
+    Standard library declarations (libc, cpython, ...) do not resolve to local files and are ignored.
+    Results and file hashes are cached for the lifetime of the scanner.
+    """
+
+    def __init__(self, sourcePath):
+        self.sourcePath = sourcePath
+        self.directCache = {}
+        self.hashCache = {}
+
+    def hash(self, filePath):
+        if filePath not in self.hashCache:
+            self.hashCache[filePath] = hashFile(filePath)
+        return self.hashCache[filePath]
+
+    def resolveModule(self, name, basePath):
+        if name.startswith("."):
+            level = len(name) - len(name.lstrip("."))
+            name = name[level:]
+            if level > 1:
+                if level - 2 >= len(basePath.parents):
+                    return None
+                searchPaths = [basePath.parents[level - 2]]
+            else:
+                searchPaths = [basePath]
+        else:
+            searchPaths = [basePath, self.sourcePath]
+
+        if not name:
+            return None
+
+        relPath = name.replace(".", "/")
+        for searchPath in searchPaths:
+            for candidate in (searchPath / f"{relPath}.pxd", searchPath / relPath / "__init__.pxd"):
+                if candidate.is_file():
+                    return candidate
+        return None
+
+    def resolveInclude(self, name, basePath):
+        for searchPath in (basePath, self.sourcePath):
+            candidate = searchPath / name
+            if candidate.is_file():
+                return candidate
+        return None
+
+    def direct(self, filePath):
+        if filePath in self.directCache:
+            return self.directCache[filePath]
+
+        try:
+            text = filePath.read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            text = ""
+
+        basePath = filePath.parent
+
+        moduleNames = []
+        for match in cimportPattern.finditer(text):
+            moduleNames += splitNames(match.group(1))
+
+        for match in fromCimportPattern.finditer(text):
+            package = match.group(1)
+            moduleNames.append(package)
+            # from package cimport module refers to package/module.pxd if it exists
+            separator = "" if package.endswith(".") else "."
+            for name in splitNames(match.group(2)):
+                moduleNames.append(f"{package}{separator}{name}")
+
+        cimportsPrefix = "cython.cimports."
+        for match in pyCimportPattern.finditer(text):
+            for name in splitNames(match.group(1)):
+                if name.startswith(cimportsPrefix):
+                    moduleNames.append(name[len(cimportsPrefix):])
+
+        for match in pyFromCimportPattern.finditer(text):
+            package = match.group(1)
+            names = splitNames(match.group(2))
+            if package:
+                moduleNames.append(package)
+                moduleNames += [f"{package}.{name}" for name in names]
+            else:
+                # from cython.cimports import module
+                moduleNames += names
+
+        dependencies = set()
+
+        # A .py or .pyx module is augmented by a .pxd file with the same name
+        if filePath.suffix in (".py", ".pyx"):
+            companionPath = filePath.with_suffix(".pxd")
+            if companionPath.is_file():
+                dependencies.add(companionPath)
+
+        for name in moduleNames:
+            dependencyPath = self.resolveModule(name, basePath)
+            if dependencyPath:
+                dependencies.add(dependencyPath)
+
+        for match in includePattern.finditer(text):
+            dependencyPath = self.resolveInclude(match.group(1), basePath)
+            if dependencyPath:
+                dependencies.add(dependencyPath)
+
+        dependencies.discard(filePath)
+
+        self.directCache[filePath] = dependencies
+        return dependencies
+
+    def dependencies(self, filePath):
+        """
+        Returns all files filePath depends on transitively, sorted.
+        """
+        found = set()
+        pending = [filePath]
+
+        while pending:
+            for dependencyPath in self.direct(pending.pop()):
+                if dependencyPath not in found and dependencyPath != filePath:
+                    found.add(dependencyPath)
+                    pending.append(dependencyPath)
+
+        return sorted(found)
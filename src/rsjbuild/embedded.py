@@ -7,10 +7,17 @@ import zipfile
 import logging
 import py_compile
 import os
+import json
+import hashlib
+import functools
+from concurrent.futures import ProcessPoolExecutor
 
 logger = logging.getLogger(__file__)
 
 from .utils import copytree, system
+from .transpile import getJobs, getProcessContext, submitWorker
+from .scanner import scanTree
+from .copyengine import CopyEngine
 
 def getEmbeddedDistribution():
     pythonVersion = sys.version_info
@@ -25,7 +32,9 @@ def getEmbeddedDistribution():
     return distributionPath
 
 def getLicenseText(target, targetPath, *args):
-    with target.open("wb") as combinedFile:
+    # Written to a new file, as target may be hardlinked to a source file. The name does not match the license pattern
+    tmpPath = target.with_name(f".{target.name}.tmp")
+    with tmpPath.open("wb") as combinedFile:
 
         for arg in args:
             try:
@@ -34,7 +43,7 @@ def getLicenseText(target, targetPath, *args):
             except:
                 pass
 
-        for licensePath in targetPath.rglob("[lL][iI][cC][eE][nN][sS][eE]*"):
+        for licensePath in scanTree(targetPath, include=["[lL][iI][cC][eE][nN][sS][eE]*"]):
             if licensePath.is_file():
                 try:
                     print(licensePath)
@@ -48,7 +57,12 @@ def getLicenseText(target, targetPath, *args):
 
                    pass
 
-def doCopyFiles(targetPath, sourcePath, createDirs=[], copyFiles=[], copyTrees=[], deleteFiles=[]):
+    os.replace(tmpPath, target)
+
+def doCopyFiles(targetPath, sourcePath, createDirs=[], copyFiles=[], copyTrees=[], deleteFiles=[], engine=None):
+    # Returns the paths of all copied files. Unchanged files are skipped, see CopyEngine
+    engine = engine or CopyEngine()
+    targets = []
 
     if createDirs:
         for dir in createDirs:
@@ -56,30 +70,29 @@ def doCopyFiles(targetPath, sourcePath, createDirs=[], copyFiles=[], copyTrees=[
             newDir.mkdir(parents=True, exist_ok=True)
 
     if copyFiles:
+        pairs = []
         for fileName in copyFiles:
             try:
                 if isinstance(fileName, str):
-                    (targetPath / fileName).parent.mkdir(parents=True, exist_ok=True)
-                    shutil.copy2(sourcePath / fileName, targetPath / fileName)
+                    pairs.append((sourcePath / fileName, targetPath / fileName))
                 else:
-                    (targetPath / fileName[1]).parent.mkdir(parents=True, exist_ok=True)
                     if fileName[0].startswith("https://") or fileName[0].startswith("http://"):
+                        (targetPath / fileName[1]).parent.mkdir(parents=True, exist_ok=True)
                         urllib.request.urlretrieve(fileName[0], filename=targetPath / fileName[1])
+                        targets.append(targetPath / fileName[1])
                     else:
-                        shutil.copy2(sourcePath / fileName[0], targetPath / fileName[1])
+                        pairs.append((sourcePath / fileName[0], targetPath / fileName[1]))
             except Exception:
                 logger.exception(fileName)
 
+        targets += engine.copyFiles(pairs, logErrors=True)
+
     if copyTrees:
         for tree in copyTrees:
             if isinstance(tree, str):
-                wrkPath = sourcePath / tree
-                (targetPath /tree).mkdir(parents=True, exist_ok=True)
-                shutil.copytree(wrkPath, targetPath / tree, dirs_exist_ok=True)
+                targets += engine.copyTree(sourcePath / tree, targetPath / tree)
             else:
-                wrkPath = sourcePath / tree[0]
-                (targetPath / tree[1]).mkdir(parents=True, exist_ok=True)
-                shutil.copytree(wrkPath, targetPath / tree[1], dirs_exist_ok=True)
+                targets += engine.copyTree(sourcePath / tree[0], targetPath / tree[1])
 
     if deleteFiles:
         for fileName in deleteFiles:
@@ -88,39 +101,138 @@ def doCopyFiles(targetPath, sourcePath, createDirs=[], copyFiles=[], copyTrees=[
             except Exception:
                 pass
 
+    return targets
+
+
+def createLibraryZip(sitePath, libraryPath, compModules, libraryMode="w"):
+    # Members are stored uncompressed, zipimport reads them without inflating
+    with zipfile.ZipFile(str(libraryPath), libraryMode, compression=zipfile.ZIP_STORED) as zipFile:
+
+        for modName in compModules:
+            try:
+                modPath = sitePath / modName
+                for srcPath in modPath.rglob("*.py"):
+                    compPath = srcPath.with_suffix(".pyc")
+                    try:
+                        py_compile.compile(str(srcPath), cfile=str(compPath), optimize=2, doraise=True)
+                    except Exception:
+                        compPath = srcPath
+
+                    arcPath = pathlib.PurePosixPath(modName) / compPath.relative_to(modPath)
+                    zipFile.write(compPath, arcname=str(arcPath))
+
+                shutil.rmtree(modPath, ignore_errors=True)
+            except Exception:
+                logger.exception(f"Compressing module {modName}")
+
+def compileBytecode(targetPath, optimize=[0], jobs=None):
+    # Unchecked hash based pycs are used without stat'ing or reading the source
+    import compileall
+
+    print(f"Compiling bytecode in {str(targetPath)} (optimize {optimize})")
+
+    if targetPath.is_file():
+        filePaths = [targetPath]
+    else:
+        # Like compileall.compile_dir, but the workers are limited by the shared worker budget
+        filePaths = []
+        for dirPath, dirNames, fileNames in os.walk(targetPath):
+            dirNames[:] = [dirName for dirName in dirNames if dirName != "__pycache__"]
+            filePaths += [pathlib.Path(dirPath) / fileName for fileName in fileNames if fileName.endswith(".py")]
+
+    if not filePaths:
+        return
+
+    compileFile = functools.partial(compileall.compile_file,
+                                    quiet=1,
+                                    optimize=list(optimize),
+                                    invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+
+    with ProcessPoolExecutor(max_workers=min(getJobs(jobs), len(filePaths)), mp_context=getProcessContext()) as executor:
+        futures = [submitWorker(executor, compileFile, str(filePath)) for filePath in filePaths]
+        success = all([future.result() for future in futures])
+
+    if not success:
+        print("Some files could not be compiled to bytecode")
 
 def createEmbedded(targetPath, exeName="main", buildPath=None, createDirs=[], copyFiles=[], copyTrees=[], deleteFiles=[], compModules=[],
-                   includeTkinter=False, removeTests=True):
+                   includeTkinter=False, removeTests=True, withLibraryZip=False, copyEngine=None):
 
     vars = sysconfig.get_config_vars()
     pPath = vars['installed_platbase']
     pPath = pathlib.Path(pPath)
 
-    shutil.rmtree(targetPath, ignore_errors=True)
-
     pythonVersion = sys.version_info
     #pythonVersionName = f"{pythonVersion.major}.{pythonVersion.minor}.{pythonVersion.micro}"
     pythonVersionNameShort = f"{pythonVersion.major}.{pythonVersion.minor}"
 
-    if sys.platform == "win32":
-        targetPath.mkdir(parents=True)
-
-        distributionPath = getEmbeddedDistribution()
+    system("uv export --no-dev --output-file build/requirements.txt")
 
-        with zipfile.ZipFile(distributionPath) as zipFile:
-            zipFile.extractall(path=targetPath)
+    # The environment is kept while its inputs are unchanged, so unchanged copies into it are skipped
+    environmentKey = getEnvironmentKey(pathlib.Path("build/requirements.txt"), exeName=exeName, compModules=compModules,
+                                       includeTkinter=includeTkinter, removeTests=removeTests, withLibraryZip=withLibraryZip)
+    infoPath = pathlib.Path("build") / "embed.json"
+    try:
+        info = json.loads(infoPath.read_text())
+    except Exception:
+        info = {}
+
+    libraryPath = buildPath / "library.zip"
+    reuse = (targetPath.is_dir() and info.get("key") == environmentKey and
+             (libraryPath.exists() or not (sys.platform == "win32" or withLibraryZip)))
+
+    if reuse:
+        print(f"Reusing the environment in {str(targetPath)}, requirements unchanged")
     else:
-        system(f"uv venv --python {pythonVersionNameShort} {str(targetPath)}")
+        infoPath.unlink(missing_ok=True)
+        shutil.rmtree(targetPath, ignore_errors=True)
+        info = {"key": environmentKey}
 
-    system("uv export --no-dev --output-file build/requirements.txt")
-    if sys.platform == "win32":
-        system(f"uv pip install --upgrade --no-deps --target {str(targetPath)} -r build/requirements.txt")
-    else:
-        os.environ["VIRTUAL_ENV"] = str(targetPath)
-        system("uv pip install --upgrade --no-deps -r build/requirements.txt")
-        del os.environ["VIRTUAL_ENV"]
+        if sys.platform == "win32":
+            targetPath.mkdir(parents=True)
+
+            distributionPath = getEmbeddedDistribution()
+
+            with zipfile.ZipFile(distributionPath) as zipFile:
+                zipFile.extractall(path=targetPath)
+        else:
+            system(f"uv venv --python {pythonVersionNameShort} {str(targetPath)}")
+
+        if sys.platform == "win32":
+            system(f"uv pip install --upgrade --no-deps --target {str(targetPath)} -r build/requirements.txt")
+        else:
+            system("uv pip install --upgrade --no-deps -r build/requirements.txt", env=dict(os.environ, VIRTUAL_ENV=str(targetPath)))
+
+    copied = doCopyFiles(targetPath, pathlib.Path("."), createDirs=createDirs, copyFiles=copyFiles, copyTrees=copyTrees, engine=copyEngine)
+
+    # Files copied by the previous build but no longer part of the copies
+    copied = sorted({copiedPath.relative_to(targetPath).as_posix() for copiedPath in copied})
+    for relPath in sorted(set(info.get("copied", [])) - set(copied)):
+        print(f"Deleting stale {relPath}")
+        (targetPath / relPath).unlink(missing_ok=True)
+    info["copied"] = copied
+
+    if not reuse:
+        setupEnvironment(targetPath, exeName, buildPath, pPath, compModules=compModules, includeTkinter=includeTkinter,
+                         removeTests=removeTests, withLibraryZip=withLibraryZip)
+
+    doCopyFiles(targetPath, pathlib.Path("."), deleteFiles=deleteFiles)
+
+    infoPath.write_text(json.dumps(info, indent=2))
+
+def getEnvironmentKey(requirementsPath, **options):
+    # Everything the embedded environment is created from, besides the copies
+    key = {
+        "python": sys.version,
+        "platform": sys.platform,
+        "requirements": requirementsPath.read_text(),
+        "options": options,
+        }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
 
-    doCopyFiles(targetPath, pathlib.Path("."), createDirs=createDirs, copyFiles=copyFiles, copyTrees=copyTrees)
+def setupEnvironment(targetPath, exeName, buildPath, pPath, compModules=[], includeTkinter=False, removeTests=True, withLibraryZip=False):
+    pythonVersion = sys.version_info
+    pythonVersionNameShort = f"{pythonVersion.major}.{pythonVersion.minor}"
 
     getLicenseText(targetPath / "license.txt", targetPath, targetPath / "../install/license.txt")
 
@@ -154,24 +266,7 @@ def createEmbedded(targetPath, exeName="main", buildPath=None, createDirs=[], co
             libraryPath = buildPath / "library.zip"
             libraryMode = "w"
 
-        with zipfile.ZipFile(str(libraryPath), libraryMode) as zipFile:
-
-            for modName in compModules:
-                try:
-                    modPath = targetPath / modName
-                    for srcPath in modPath.rglob("*.py"):
-                        compPath = srcPath.with_suffix(".pyc")
-                        try:
-                            py_compile.compile(str(srcPath), cfile=str(compPath), optimize=2, doraise=True)
-                        except Exception:
-                            compPath = srcPath
-
-                        arcPath = pathlib.PurePosixPath(modName) / compPath.relative_to(modPath)
-                        zipFile.write(compPath, arcname=str(arcPath))
-
-                    shutil.rmtree(modPath, ignore_errors=True)
-                except Exception:
-                    logger.exception(f"Compressing module {modName}")
+        createLibraryZip(targetPath, libraryPath, compModules, libraryMode=libraryMode)
 
         for distPath in targetPath.glob("*.dist-info"):
             print(f"Deleting {distPath}")
@@ -184,5 +279,6 @@ def createEmbedded(targetPath, exeName="main", buildPath=None, createDirs=[], co
         shutil.rmtree(targetPath / "bin", ignore_errors=True)
         shutil.rmtree(targetPath / "__pycache__", ignore_errors=True)
 
-    doCopyFiles(targetPath, pathlib.Path("."), deleteFiles=deleteFiles)
-
+    elif withLibraryZip:
+        sitePath = targetPath / "lib" / f"python{pythonVersionNameShort}" / "site-packages"
+        createLibraryZip(sitePath, buildPath / "library.zip", compModules)
@@ -1,6 +1,7 @@
 import subprocess
 import json
 import sys
+import os
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,6 +32,17 @@ def getCommit():
         return "0000000000000000000000000000000000000000"
 
 
+def getSourceDateEpoch():
+    # Timestamp for reproducible output, SOURCE_DATE_EPOCH or the commit time of HEAD
+    if os.environ.get("SOURCE_DATE_EPOCH"):
+        return int(os.environ["SOURCE_DATE_EPOCH"])
+    try:
+        result = subprocess.run(["git", "log", "-1", "--format=%ct"], capture_output=True, text=True)
+        return int(result.stdout.strip())
+    except Exception:
+        return 315532800
+
+
 def setVersion(targetPath, exeName=None):
 
     version = getVersion()
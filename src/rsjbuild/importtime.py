@@ -0,0 +1,36 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def summarize(data, top=20):
+    modules = data["modules"]
+
+    # exec time includes nested imports of compiled modules, self time does not
+    childTime = {}
+    for module in modules:
+        if module["parent"]:
+            childTime[module["parent"]] = childTime.get(module["parent"], 0.0) + module["create"] + module["exec"]
+
+    for module in modules:
+        module["cumulative"] = module["create"] + module["exec"]
+        module["self"] = module["cumulative"] - childTime.get(module["name"], 0.0)
+
+    lines = [f"Import times of {data.get('executable', '')}: {len(modules)} compiled modules", ""]
+
+    lines.append("    self [ms]  cumulative [ms]  create [ms]  module")
+    for module in sorted(modules, key=lambda x: x["self"], reverse=True)[:top]:
+        lines.append(f"{module['self'] * 1000:13.2f}  {module['cumulative'] * 1000:15.2f}  {module['create'] * 1000:11.2f}  {module['name']}")
+
+    lines += ["", "Import tree (cumulative [ms]):"]
+    for module in sorted(modules, key=lambda x: x["start"]):
+        lines.append(f"{module['cumulative'] * 1000:10.2f}  {'  ' * module['depth']}{module['name']}")
+
+    return lines
+
+
+def importtime(parms, config):
+    data = json.loads(parms.input.read_text())
+
+    print("\n".join(summarize(data, top=parms.top)))
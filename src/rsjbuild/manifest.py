@@ -0,0 +1,64 @@
+import sys
+import pathlib
+import json
+import hashlib
+import sysconfig
+import logging
+
+logger = logging.getLogger(__file__)
+
+manifestName = "manifest.json"
+
+
+def hashFile(filePath):
+    with filePath.open("rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def getBuildKey(compiler, compileArgs=[], keyExtra=None):
+    # Everything besides the source itself that changes the generated C code or object files
+    from Cython import __version__ as cythonVersion
+
+    buildKey = {
+        "cython": cythonVersion,
+        "macros": [list(macro) for macro in compiler.macros],
+        "includeDirs": compiler.include_dirs,
+        "compileArgs": list(compileArgs),
+        "compiler": getattr(compiler, "compiler_so", compiler.compiler_type),
+        "abi": sysconfig.get_config_var("SOABI") or sys.implementation.cache_tag,
+        "python": sys.version,
+        "extra": keyExtra,
+        }
+
+    return hashlib.sha256(json.dumps(buildKey, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def getModuleKey(sourceHash, buildKey, dependencyHashes=[]):
+    key = ":".join([buildKey, sourceHash] + list(dependencyHashes))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def getLinkKey(inputs, linkerArgs=[]):
+    entries = list(linkerArgs)
+    for input in sorted(map(str, inputs)):
+        inputPath = pathlib.Path(input)
+        if inputPath.is_file():
+            entries.append(f"{input}:{hashFile(inputPath)}")
+        else:
+            entries.append(input)
+    return hashlib.sha256("\n".join(entries).encode("utf-8")).hexdigest()
+
+
+def loadManifest(buildPath):
+    manifestPath = buildPath / manifestName
+    try:
+        return json.loads(manifestPath.read_text())
+    except Exception:
+        return {}
+
+
+def saveManifest(buildPath, manifest):
+    manifestPath = buildPath / manifestName
+    tmpPath = manifestPath.with_suffix(".tmp")
+    tmpPath.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmpPath.replace(manifestPath)
@@ -0,0 +1,114 @@
+import os
+import shutil
+import pathlib
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__file__)
+
+
+def getCachePath(cachePath=None):
+    if cachePath:
+        return pathlib.Path(cachePath)
+    if "RSJBUILD_CACHE" in os.environ:
+        return pathlib.Path(os.environ["RSJBUILD_CACHE"])
+    if "XDG_CACHE_HOME" in os.environ:
+        return pathlib.Path(os.environ["XDG_CACHE_HOME"]) / "rsjbuild"
+    return pathlib.Path.home() / ".cache" / "rsjbuild"
+
+
+class ObjectCache:
+    """
+    Content addressed cache for generated C files and object files, shared between projects and checkouts.
+
+    Entries are directories named after the cache key. They are written to a temporary directory and renamed
+    into place, so parallel builds never see partial entries. The entry mtime is the LRU timestamp.
+    """
+
+    def __init__(self, cachePath=None, maxSize=2048):
+        self.cachePath = getCachePath(cachePath)
+        self.maxSize = maxSize * 1024 * 1024
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def getKey(self, moduleKey, moduleName, objSuffix):
+        return hashlib.sha256(f"{moduleKey}:{moduleName}:{objSuffix}".encode("utf-8")).hexdigest()
+
+    def entryPath(self, key):
+        return self.cachePath / key[:2] / key
+
+    def fetch(self, key, targetPaths):
+        entryPath = self.entryPath(key)
+        try:
+            # Targets are replaced atomically, an entry evicted meanwhile leaves no partial files
+            for targetPath in targetPaths:
+                tmpPath = targetPath.with_name(f"{targetPath.name}.{threading.get_ident()}.tmp")
+                try:
+                    shutil.copyfile(entryPath / f"module{targetPath.suffix}", tmpPath)
+                    os.replace(tmpPath, targetPath)
+                except OSError:
+                    tmpPath.unlink(missing_ok=True)
+                    raise
+            os.utime(entryPath)
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return False
+
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, sourcePaths):
+        entryPath = self.entryPath(key)
+        if entryPath.exists():
+            return
+
+        tmpPath = self.cachePath / "tmp" / f"{key}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            tmpPath.mkdir(parents=True, exist_ok=True)
+            for sourcePath in sourcePaths:
+                shutil.copyfile(sourcePath, tmpPath / f"module{sourcePath.suffix}")
+            entryPath.parent.mkdir(parents=True, exist_ok=True)
+            tmpPath.rename(entryPath)
+        except OSError:
+            # Another build stored the same entry concurrently
+            shutil.rmtree(tmpPath, ignore_errors=True)
+            return
+
+        with self.lock:
+            self.stores += 1
+
+    def evict(self):
+        entries = []
+        totalSize = 0
+
+        for bucketPath in self.cachePath.glob("??"):
+            for entryPath in bucketPath.iterdir():
+                try:
+                    size = sum(filePath.stat().st_size for filePath in entryPath.iterdir())
+                    entries.append((entryPath.stat().st_mtime, size, entryPath))
+                    totalSize += size
+                except OSError:
+                    pass
+
+        if totalSize <= self.maxSize:
+            return
+
+        entries.sort()
+        for (mtime, size, entryPath) in entries:
+            if totalSize <= self.maxSize:
+                break
+            shutil.rmtree(entryPath, ignore_errors=True)
+            totalSize -= size
+            self.evictions += 1
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        hitRate = (100.0 * self.hits / lookups) if lookups else 0.0
+        return f"Object cache {str(self.cachePath)}: {self.hits} hits, {self.misses} misses ({hitRate:.1f}% hit rate), {self.stores} stored, {self.evictions} evicted"
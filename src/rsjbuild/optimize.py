@@ -0,0 +1,99 @@
+import sys
+import json
+import shutil
+import hashlib
+import logging
+
+logger = logging.getLogger(__file__)
+
+from .compile import compileTargets
+from .dependencies import DependencyScanner
+from .utils import system
+
+
+def getLtoArgs():
+    if sys.platform == "win32":
+        return ["/GL"], ["/LTCG"]
+    # Objects are compiled position independent, the link time code generation has to match
+    return ["-flto=auto"], ["-flto=auto", "-fPIC"]
+
+
+def getProfileKey(sourcePath, targets):
+    scanner = DependencyScanner(sourcePath)
+
+    sourceSet = set()
+    entries = []
+    for exeName, target in sorted(targets.items()):
+        entries.append(f"{exeName}:{target['training']}")
+        for source in target["sources"]:
+            sourceSet.update(sourcePath.glob(source))
+
+    for filePath in sorted(sourceSet):
+        entries.append(f"{filePath.as_posix()}:{scanner.hash(filePath)}")
+        for dependency in scanner.dependencies(filePath):
+            entries.append(f"{dependency.as_posix()}:{scanner.hash(dependency)}")
+
+    return hashlib.sha256("\n".join(entries).encode("utf-8")).hexdigest()
+
+
+def compileOptimized(sourcePath, targets, optimize=None, **kwargs):
+    """
+    Compiles executables (see compileTargets) with link time optimization (optimize="lto") or with profile
+    guided and link time optimization (optimize="pgo").
+
+    The pgo mode builds instrumented executables, runs the training command of each target ({exe} is replaced
+    by the executable path) and rebuilds with the collected profile. The profile is reused until sources change.
+    """
+    if not optimize:
+        return compileTargets(sourcePath, targets, **kwargs)
+
+    ltoCompileArgs, ltoLinkArgs = getLtoArgs()
+
+    if optimize == "pgo" and sys.platform != "linux":
+        print(f"Profile guided optimization is not supported on {sys.platform}, using lto")
+        optimize = "lto"
+
+    if optimize == "lto":
+        return compileTargets(sourcePath, targets, extraCompileArgs=ltoCompileArgs, extraLinkArgs=ltoLinkArgs, **kwargs)
+
+    if optimize != "pgo":
+        raise ValueError(f"Unknown optimization mode {optimize}")
+
+    for exeName, target in targets.items():
+        if not target.get("training"):
+            raise ValueError(f"Profile guided optimization of {exeName} needs a training command")
+
+    profilePath = (sourcePath / "build" / "profile").resolve()
+    profileInfoPath = profilePath / "profile.json"
+
+    profileKey = getProfileKey(sourcePath, targets)
+
+    try:
+        profileInfo = json.loads(profileInfoPath.read_text())
+    except Exception:
+        profileInfo = {}
+
+    if profileInfo.get("key") != profileKey:
+        print(f"Building instrumented {', '.join(targets)}")
+        shutil.rmtree(profilePath, ignore_errors=True)
+        profilePath.mkdir(parents=True, exist_ok=True)
+
+        exePaths = compileTargets(sourcePath, targets,
+                                  extraCompileArgs=[f"-fprofile-generate={str(profilePath)}", "-fprofile-update=atomic"],
+                                  extraLinkArgs=["-fprofile-generate"],
+                                  **kwargs)
+
+        # Profiles of modules shared by several executables are accumulated over all trainings
+        for exeName, target in targets.items():
+            print(f"Training {exeName}")
+            system(target["training"].format(exe=str(exePaths[exeName].resolve())))
+
+        profileInfoPath.write_text(json.dumps({"key": profileKey}))
+    else:
+        print(f"Reusing profile data for {', '.join(targets)}")
+
+    return compileTargets(sourcePath, targets,
+                          extraCompileArgs=[f"-fprofile-use={str(profilePath)}", "-fprofile-partial-training", "-Wno-missing-profile"] + ltoCompileArgs,
+                          extraLinkArgs=ltoLinkArgs,
+                          keyExtra=profileKey,
+                          **kwargs)
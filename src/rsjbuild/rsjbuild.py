@@ -1,4 +1,5 @@
 import argparse
+import os
 import os.path
 import logging
 import pathlib
@@ -27,6 +28,12 @@ def main():
     buildParser = subparsers.add_parser("build", help="Build distribution")
 
     buildParser.add_argument("--force", action="store_true", help="Force recompile")
+    buildParser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of parallel build tasks and compile jobs")
+    buildParser.add_argument("--noCache", action="store_true", help="Do not use the shared object cache")
+    buildParser.add_argument("--optimize", choices=["lto", "pgo"], default=None, help="Optimization mode for all executables (overrides build.json)")
+    buildParser.add_argument("--annotate", action="store_true", help="Write a Cython annotation hotspot report")
+    buildParser.add_argument("--importTime", action="store_true", help="Record import times of compiled modules to importtime.json")
+    buildParser.add_argument("--traceTop", type=int, default=10, help="Number of slowest steps shown in the build trace summary")
     buildParser.add_argument("--buildEmbed", action="store_true", help="Build embed directory")
     buildParser.add_argument("--withInstaller", action="store_true", help="Generate installer")
     buildParser.add_argument("--withZip", action="store_true", help="Generate zip distribution")
@@ -50,6 +57,21 @@ def main():
     keytoolParser.add_argument("output", type=pathlib.Path, help="Output file")
     keytoolParser.set_defaults(func=doKeytool)
 
+    importTimeParser = subparsers.add_parser("importtime", help="Summarize import times recorded by an executable")
+    importTimeParser.add_argument("--top", type=int, default=20, help="Number of slowest modules to show")
+    importTimeParser.add_argument("input", type=pathlib.Path, help="Import time file")
+    importTimeParser.set_defaults(func=doImportTime)
+
+    benchParser = subparsers.add_parser("bench", help="Benchmark startup of built executables")
+    benchParser.add_argument("--runs", type=int, default=None, help="Number of runs per executable")
+    benchParser.add_argument("--args", type=str, default=None, help="Arguments passed to the executables")
+    benchParser.add_argument("--baseline", type=pathlib.Path, default=None, help="Baseline file")
+    benchParser.add_argument("--threshold", type=float, default=None, help="Regression threshold in percent")
+    benchParser.add_argument("--coldRuns", type=int, default=None, help="Number of cold runs per executable")
+    benchParser.add_argument("--coldThreshold", type=float, default=None, help="Regression threshold for cold starts in percent")
+    benchParser.add_argument("--updateBaseline", action="store_true", help="Write results as new baseline")
+    benchParser.set_defaults(func=doBench)
+
     versionParser = subparsers.add_parser("version", help="Display version")
     versionParser.set_defaults(func=doVersion)
 
@@ -103,6 +125,16 @@ def doKeytool(parms, config):
     from .keytool import keytool
     keytool(parms, config)
 
+def doImportTime(parms, config):
+
+    from .importtime import importtime
+    importtime(parms, config)
+
+def doBench(parms, config):
+
+    from .bench import bench
+    bench(parms, config)
+
 def doVersion(parms, config):
     print(rsjbuildVersion)
 
@@ -0,0 +1,159 @@
+import os
+import re
+import sys
+import glob
+import pathlib
+import threading
+import logging
+
+logger = logging.getLogger(__file__)
+
+
+def translatePattern(pattern):
+    # Patterns starting with / are anchored at the scanned root, others match the end of the path like Path.match
+    pattern = pattern.replace("\\", "/")
+    if pattern.startswith("/"):
+        return glob.translate(pattern.lstrip("/"), recursive=True, include_hidden=True, seps="/")
+    return "(?:.*/)?" + glob.translate(pattern, recursive=True, include_hidden=True, seps="/")
+
+
+class Matcher:
+    """
+    All glob patterns of a list compiled into one regular expression, matched against posix paths relative to
+    the scanned root.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns or [])
+        self.regex = None
+        if self.patterns:
+            flags = re.IGNORECASE if sys.platform == "win32" else 0
+            self.regex = re.compile("|".join(f"(?:{translatePattern(pattern)})" for pattern in self.patterns), flags)
+
+    def __bool__(self):
+        return self.regex is not None
+
+    def match(self, relPath):
+        return self.regex is not None and self.regex.match(relPath) is not None
+
+
+class TreeScanner:
+    """
+    Walks directory trees with os.scandir. Ignored directories are pruned without entering them.
+
+    Directory listings are cached for the rest of the build, so stages walking the same tree with different
+    patterns share the work. Stages writing into a tree invalidate it (the scheduler does this for the declared
+    outputs of every task).
+    """
+
+    def __init__(self):
+        self.listings = {}
+        self.lock = threading.Lock()
+
+    def listDir(self, dirPath):
+        with self.lock:
+            listing = self.listings.get(dirPath)
+        if listing is not None:
+            return listing
+
+        dirs = []
+        files = []
+        try:
+            with os.scandir(dirPath) as entries:
+                for entry in entries:
+                    # Symbolic links to directories are not followed, as in Path.glob("**")
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+
+        listing = (sorted(dirs), sorted(files))
+        with self.lock:
+            self.listings[dirPath] = listing
+        return listing
+
+    def clear(self):
+        with self.lock:
+            self.listings = {}
+
+    def invalidate(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            for dirPath in list(self.listings):
+                if dirPath == path or dirPath.startswith(path + os.sep) or path.startswith(dirPath + os.sep):
+                    del self.listings[dirPath]
+
+    def scan(self, rootPath, include=None, ignore=None, dirs=False, maxDepth=None):
+        """
+        Returns the files (and directories with dirs=True) below rootPath in sorted order.
+
+        include limits the result to matching paths, ignore drops matching paths and the subtrees of
+        matching directories. maxDepth limits the number of path components below rootPath.
+        """
+        rootPath = pathlib.Path(rootPath)
+        includeMatcher = include if isinstance(include, Matcher) else Matcher(include)
+        ignoreMatcher = ignore if isinstance(ignore, Matcher) else Matcher(ignore)
+
+        result = []
+
+        def walk(dirPath, relDir, depth):
+            subDirs, files = self.listDir(dirPath)
+
+            for name in files:
+                relPath = relDir + name
+                if ignoreMatcher.match(relPath):
+                    continue
+                if includeMatcher and not includeMatcher.match(relPath):
+                    continue
+                result.append(rootPath / relPath)
+
+            for name in subDirs:
+                relPath = relDir + name
+                if ignoreMatcher.match(relPath):
+                    continue
+                if dirs and (not includeMatcher or includeMatcher.match(relPath)):
+                    result.append(rootPath / relPath)
+                if maxDepth is None or depth < maxDepth:
+                    walk(os.path.join(dirPath, name), relPath + "/", depth + 1)
+
+        walk(os.path.abspath(rootPath), "", 1)
+        return result
+
+    def glob(self, pattern, rootPath="."):
+        """
+        Files and directories matching pattern (relative to rootPath). Only the directory given by the literal
+        leading components of the pattern is walked, and only as deep as the pattern reaches without **.
+        """
+        parts = pattern.replace("\\", "/").split("/")
+
+        literal = []
+        while len(parts) > 1 and not glob.has_magic(parts[0]):
+            literal.append(parts.pop(0))
+
+        # An absolute pattern starts with an empty component
+        if literal and literal[0] == "":
+            literal[0] = "/"
+
+        maxDepth = None if "**" in parts else len(parts)
+
+        basePath = pathlib.Path(rootPath, *literal)
+        result = self.scan(basePath, include=["/" + "/".join(parts)], dirs=True, maxDepth=maxDepth)
+
+        # A trailing ** matches the directory itself as well, as in Path.glob
+        if parts[-1] == "**" and basePath.is_dir():
+            result.insert(0, basePath)
+        return result
+
+
+scanner = TreeScanner()
+
+
+def scanTree(rootPath, include=None, ignore=None, dirs=False, maxDepth=None):
+    return scanner.scan(rootPath, include=include, ignore=ignore, dirs=dirs, maxDepth=maxDepth)
+
+
+def invalidate(*paths):
+    for path in paths:
+        scanner.invalidate(path)
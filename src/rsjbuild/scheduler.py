@@ -0,0 +1,115 @@
+import os
+import pathlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__file__)
+
+from .transpile import getJobs, setWorkerBudget
+from .buildtrace import span
+from .scanner import invalidate
+
+
+def normPath(path):
+    return pathlib.Path(os.path.normpath(os.path.abspath(path)))
+
+
+def overlaps(pathsA, pathsB):
+    for a in pathsA:
+        for b in pathsB:
+            if a == b or a in b.parents or b in a.parents:
+                return True
+    return False
+
+
+class Task:
+
+    def __init__(self, name, func, deps=[], inputs=[], outputs=[]):
+        self.name = name
+        self.func = func
+        self.deps = set(deps)
+        self.inputs = [normPath(path) for path in inputs]
+        self.outputs = [normPath(path) for path in outputs]
+
+
+class Scheduler:
+    """
+    Runs build tasks in a thread pool as soon as their dependencies are done.
+
+    Besides the explicit dependencies, a task depends on every task added before it whose outputs overlap its
+    inputs or outputs (a path overlaps its parent and child paths). Tasks only touching unrelated paths run
+    concurrently. The first failure stops scheduling, running tasks are waited for and the error is raised.
+
+    The worker pools of running tasks share the jobs budget: every busy worker holds one of jobs slots.
+    """
+
+    def __init__(self, jobs=None):
+        self.jobs = getJobs(jobs)
+        self.tasks = {}
+
+    def add(self, name, func, deps=[], inputs=[], outputs=[]):
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task {name}")
+
+        task = Task(name, func, deps, inputs, outputs)
+
+        for dep in task.deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Task {name} depends on unknown task {dep}")
+
+        for other in self.tasks.values():
+            if overlaps(task.inputs + task.outputs, other.outputs):
+                task.deps.add(other.name)
+
+        self.tasks[name] = task
+        return name
+
+    def runTask(self, task):
+        with span(task.name, "stage"):
+            try:
+                task.func()
+            finally:
+                # Cached directory listings of everything the task wrote are stale
+                invalidate(*task.outputs)
+
+    def run(self):
+        pending = dict(self.tasks)
+        done = set()
+        running = {}
+        error = None
+
+        print(f"Running {len(pending)} build tasks with {self.jobs} jobs")
+
+        setWorkerBudget(self.jobs)
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                while pending or running:
+                    if not error:
+                        for name, task in list(pending.items()):
+                            if len(running) >= self.jobs:
+                                break
+                            if task.deps <= done:
+                                del pending[name]
+                                running[executor.submit(self.runTask, task)] = name
+
+                    if not running:
+                        break
+
+                    finished, notFinished = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        try:
+                            future.result()
+                            done.add(name)
+                        except Exception as e:
+                            print(f"Build task {name} failed: {type(e).__name__}: {e}")
+                            if not error:
+                                error = e
+        finally:
+            setWorkerBudget(None)
+
+        if error:
+            raise error
+
+        if pending:
+            raise ValueError(f"Unresolved build tasks: {', '.join(pending)}")
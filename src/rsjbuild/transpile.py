@@ -0,0 +1,168 @@
+import os
+import time
+import logging
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+logger = logging.getLogger(__file__)
+
+from .buildtrace import tracer
+
+
+def getJobs(jobs=None):
+    if jobs:
+        return max(1, int(jobs))
+    return os.cpu_count() or 1
+
+
+# Busy workers of all concurrently running build tasks share the --jobs budget, see Scheduler
+workerSlots = None
+
+
+def setWorkerBudget(jobs=None):
+    global workerSlots
+    workerSlots = threading.BoundedSemaphore(getJobs(jobs)) if jobs else None
+
+
+@contextlib.contextmanager
+def workerSlot():
+    """
+    Holds a worker slot while a thread does CPU bound work or waits for a compiler process.
+    """
+    slots = workerSlots
+    if slots is None:
+        yield
+        return
+
+    with slots:
+        yield
+
+
+def submitWorker(executor, func, *args):
+    """
+    Submits func to a process pool once a worker slot is free. The slot is released when it is done.
+    """
+    slots = workerSlots
+    if slots is None:
+        return executor.submit(func, *args)
+
+    slots.acquire()
+    try:
+        future = executor.submit(func, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda future: slots.release())
+    return future
+
+
+def getProcessContext():
+    # Forking while the scheduler runs other threads may copy their held locks, the fork server starts clean workers
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return None
+
+
+def initWorker():
+    # Import Cython once per worker process, it stays loaded for all modules compiled by this worker
+    from Cython.Compiler import Options, Main  # noqa: F401
+
+    Options.docstrings = False
+
+
+def getDirectives(filePath, sourcePath, directivePatterns):
+    # All patterns matching the module path (relative to sourcePath) are merged in configuration order
+    relPath = filePath.relative_to(sourcePath)
+    directives = {}
+    for pattern, patternDirectives in directivePatterns.items():
+        if relPath.full_match(pattern):
+            directives.update(patternDirectives)
+    return directives
+
+
+def cythonizeModule(sourcePath, outputPath, embed=False, directives=None, annotate=False, sharedUtility=None):
+    # Returns (sourcePath, error, start, duration, pid), the timing is recorded as a trace span by the caller
+    start = time.time()
+    sourcePath, error = transpileModule(sourcePath, outputPath, embed, directives, annotate, sharedUtility)
+    return sourcePath, error, start, time.time() - start, os.getpid()
+
+
+def transpileModule(sourcePath, outputPath, embed=False, directives=None, annotate=False, sharedUtility=None):
+    from Cython.Compiler import Options
+    from Cython.Compiler.Main import CompilationOptions, default_options, compile_single
+
+    Options.embed = "main" if embed else None
+
+    # With sharedUtility the module imports the shared utility code (memoryviews) from that module
+    options = CompilationOptions(default_options,
+                                 language_level=3,
+                                 output_file=str(outputPath),
+                                 compiler_directives=dict(directives or {}),
+                                 annotate=annotate,
+                                 shared_utility_qualified_name=sharedUtility)
+
+    try:
+        result = compile_single(str(sourcePath), options, None)
+    except Exception as e:
+        return str(sourcePath), f"{type(e).__name__}: {e}"
+
+    if result.num_errors:
+        return str(sourcePath), f"{result.num_errors} error(s)"
+
+    return str(sourcePath), None
+
+
+def generateSharedUtility(outputPath):
+    # C source of the shared utility module, named after outputPath. Returns the same tuple as cythonizeModule
+    from Cython.Build.SharedModule import generate_shared_module
+    from Cython.Compiler.Main import CompilationOptions, default_options
+
+    start = time.time()
+    error = None
+    try:
+        options = CompilationOptions(default_options, language_level=3, shared_c_file_path=str(outputPath))
+        err, enddata = generate_shared_module(options)
+        if err is not None:
+            error = f"{type(err).__name__}: {err}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    return str(outputPath), error, start, time.time() - start, os.getpid()
+
+
+def cythonize(modules, jobs=None, sharedUtility=None):
+    """
+    Transpiles (sourcePath, outputPath, embed[, directives[, annotate[, sharedUtility]]]) tuples to C in a
+    process pool. With sharedUtility, the C source of the shared utility module is generated to that path too.
+
+    Failures of single modules do not stop the other workers. All failures are reported at the end.
+    """
+    if not modules and not sharedUtility:
+        return
+
+    jobs = min(getJobs(jobs), max(len(modules), 1))
+    print(f"Cythonizing {len(modules)} modules with {jobs} jobs")
+
+    failures = []
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initWorker, mp_context=getProcessContext()) as executor:
+        futures = [submitWorker(executor, cythonizeModule, *module) for module in modules]
+        if sharedUtility:
+            futures.append(submitWorker(executor, generateSharedUtility, sharedUtility))
+
+        for future in as_completed(futures):
+            sourcePath, error, start, duration, pid = future.result()
+
+            args = {"source": sourcePath}
+            if error:
+                args["error"] = error
+            tracer.add(f"cython {sourcePath}", "cython", start, duration, args, pid=pid, tid=pid)
+
+            if error:
+                print(f"Cython failed for {sourcePath}: {error}")
+                failures.append(sourcePath)
+
+    if failures:
+        raise ValueError(f"Cython failed for {len(failures)} module(s): {', '.join(sorted(failures))}")
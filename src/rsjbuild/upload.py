@@ -5,6 +5,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 from .utils import system
+from .scanner import scanner
 
 def rename(renames, version):
     for target, source in renames.items:
@@ -17,7 +18,7 @@ def upload(uploads, version, uploadPrefix):
 
     for target, source in uploads.items():
 
-        for sourcePath in pathlib.Path(".").glob(source):
+        for sourcePath in scanner.glob(source):
             if sourcePath.name == "":
                 continue
 
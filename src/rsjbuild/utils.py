@@ -3,19 +3,35 @@ import os
 import os.path
 import sys
 import shutil
+import subprocess
 import logging
 
 logger = logging.getLogger(__file__)
 
+from .buildtrace import span, shortCommand
+
 def chmodRW(path):
     path.chmod(path.stat().st_mode | stat.S_IWRITE | stat.S_IREAD | stat.S_IWUSR | stat.S_IRUSR | stat.S_IWGRP | stat.S_IRGRP)
 
-def system(cmd):
+def system(cmd, env=None):
+    # Other build tasks run concurrently, variables for the command are passed in env instead of os.environ
     print(cmd)
-    ret = os.system(cmd)
+    with span(shortCommand(cmd), "subprocess", command=cmd) as args:
+        ret = subprocess.run(cmd, shell=True, env=env).returncode
+        args["exitCode"] = ret
     if ret:
         raise ValueError
 
+def replaceFile(targetPath, data):
+    # Writes a new file and renames it over targetPath. A target hardlinked to its source ("copyMode": "hardlink")
+    # is replaced instead of written through
+    tmpPath = targetPath.with_name(targetPath.name + ".tmp")
+    if isinstance(data, str):
+        tmpPath.write_text(data)
+    else:
+        tmpPath.write_bytes(data)
+    os.replace(tmpPath, targetPath)
+
 def pythonCall(cmd):
     system(f"{sys.executable} {cmd}")
 
@@ -38,4 +54,10 @@ def template(templatePath, targetPath, **kwargs):
 
     content = template.render(**kwargs)
 
+    # Keep the target untouched if the rendered content did not change
+    if targetPath.exists() and targetPath.read_text() == content:
+        return False
+
     targetPath.write_text(content)
+    return True
+
@@ -0,0 +1,55 @@
+import pathlib
+import unittest
+
+import addict
+
+from rsjbuild.build import addWebTasks
+from rsjbuild.scheduler import Scheduler
+
+
+class WebTasksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = addict.Dict({
+            "pnpm": ["web"],
+            "require": {"app": "prepare.py"},
+            "gzip": ["embed/www"],
+            "precompress": {"gzip": 9},
+            })
+
+        self.scheduler = Scheduler(jobs=4)
+        self.scheduler.add("embed", None, outputs=["embed", "build/requirements.txt"])
+        self.scheduler.add("templates", None, outputs=["embed/config.json"])
+        addWebTasks(self.scheduler, self.config, pathlib.Path("build"), deps=["embed", "templates"])
+
+    def ancestors(self, name):
+        tasks = self.scheduler.tasks
+        result = set()
+        pending = list(tasks[name].deps)
+        while pending:
+            dep = pending.pop()
+            if dep not in result:
+                result.add(dep)
+                pending += tasks[dep].deps
+        return result
+
+    def testDependencies(self):
+        self.assertEqual(self.ancestors("pnpm:web"), {"embed", "templates"})
+        self.assertEqual(self.ancestors("require:app"), {"embed", "templates", "pnpm:web"})
+        self.assertLessEqual({"embed", "templates", "pnpm:web", "require:app"}, self.ancestors("precompress"))
+
+    def testOrder(self):
+        order = []
+        for name, task in self.scheduler.tasks.items():
+            task.func = lambda name=name: order.append(name)
+
+        self.scheduler.run()
+
+        self.assertEqual(len(order), 5)
+        for before, after in [("embed", "pnpm:web"), ("templates", "pnpm:web"), ("pnpm:web", "require:app"),
+                              ("require:app", "precompress")]:
+            self.assertLess(order.index(before), order.index(after))
+
+
+if __name__ == "__main__":
+    unittest.main()